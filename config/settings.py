@@ -12,17 +12,22 @@ TRACK_FORMULA_CHANGES = True           # 追蹤公式變更
 IGNORE_INDIRECT_CHANGES = True         # 忽略間接影響
 ENABLE_BLACK_CONSOLE = True
 CONSOLE_POPUP_ON_COMPARISON = True
+PLAIN_DIFF_WHEN_NO_TTY = False         # 輸出不是終端機且黑色 console 未運行時，比較表格改用 tab 分隔純文字（預設關閉，保留原有表格格式）
 CONSOLE_ALWAYS_ON_TOP = False           # 新增：是否始終置頂
 CONSOLE_TEMP_TOPMOST_DURATION = 5       # 新增：臨時置頂持續時間（秒）
 CONSOLE_INITIAL_TOPMOST_DURATION = 2    # 新增：初始置頂持續時間（秒）
 SHOW_COMPRESSION_STATS = False          # 關閉壓縮統計顯示
 SHOW_DEBUG_MESSAGES = False             # 關閉調試訊息
 AUTO_UPDATE_BASELINE_AFTER_COMPARE = True  # 比較後自動更新基準線
+BASELINE_SAVE_DEBOUNCE_SEC = 0.5  # 比較後的基準線更新延遲寫入秒數，期間同一檔案的多次更新只寫一次；0 = 即時寫入
+RAW_HASH_PRECHECK = False  # 檔案簽名不同但大小相同時先比較原始檔案位元組雜湊，與基準線記錄相同即毋須解析 Excel（需額外讀取整個檔案）
 SCAN_ALL_MODE = True
 MAX_CHANGES_TO_DISPLAY = 20 # 限制顯示的變更數量，0 表示不限制
+MAX_DIFF_ROWS = 300 # 每個比較表格最多輸出的行數（包括換行），0 表示不限制
 USE_LOCAL_CACHE = True
 CACHE_FOLDER = r"C:\Users\user\Desktop\watchdog\cache_folder"
 ENABLE_FAST_MODE = True
+BASELINE_WORKERS = 1                   # 建立基準線的並行進程數，1 = 單進程（解析與背景寫入重疊）
 ENABLE_TIMEOUT = True
 FILE_TIMEOUT_SECONDS = 120
 ENABLE_MEMORY_MONITOR = True
@@ -30,16 +35,32 @@ MEMORY_LIMIT_MB = 2048
 ENABLE_RESUME = True
 FORMULA_ONLY_MODE = True
 DEBOUNCE_INTERVAL_SEC = 2
+DEBOUNCE_MAX_TRACKED_FILES = 1024  # 防抖動最多記住幾多個檔案的最近事件時間（超出時移除最久未有事件的檔案）
 
 # =========== Compression Config ============
-# 預設壓縮格式：'lz4' 用於頻繁讀寫, 'zstd' 用於長期存儲, 'gzip' 用於兼容性
-DEFAULT_COMPRESSION_FORMAT = 'lz4'  # 'lz4', 'zstd', 'gzip'
+# 預設壓縮格式：'zstd' 速度快且壓縮率高, 'lz4' 用於極速讀寫, 'gzip' 用於兼容性
+# zstandard 未安裝時會自動降級到 lz4，再降級到 gzip
+DEFAULT_COMPRESSION_FORMAT = 'zstd'  # 'zstd', 'lz4', 'gzip'
 
 # 壓縮級別設定
 LZ4_COMPRESSION_LEVEL = 1       # LZ4: 0-16, 越高壓縮率越好但越慢
 ZSTD_COMPRESSION_LEVEL = 3      # Zstd: 1-22, 推薦 3-6
+ZSTD_THREADS = -1               # Zstd 壓縮線程數: -1 = 使用所有 CPU 核心, 0 = 單線程
 GZIP_COMPRESSION_LEVEL = 6      # gzip: 1-9, 推薦 6
 
+# 基準線 cells 以每工作表平行陣列 (addrs/values/formulas) 儲存，避免每格重複 "formula"/"value" 鍵
+# 載入時會自動還原，舊格式基準線亦可照常讀取
+USE_SOA_CELLS = True
+
+# 在記憶體保留最近載入的基準線份數（按檔案大小及修改時間判斷是否仍然有效），0 = 不快取
+BASELINE_CACHE_SIZE = 2
+# 基準線快取總大小上限 (MB)，按壓縮後的基準線檔案大小估算（還原後佔用的記憶體通常大數十倍）；
+# 超過上限的單一基準線不會快取；記憶體使用量超出 MEMORY_LIMIT_MB 時快取會被清空
+BASELINE_CACHE_MAX_MB = 8
+
+# 直接以 iterparse 解析工作表 XML 提取儲存格（唔建立 openpyxl cell 物件），遇到不支援嘅內容會自動改用 openpyxl 逐格讀取
+USE_DIRECT_XML_READER = True
+
 # 歸檔設定
 ENABLE_ARCHIVE_MODE = True              # 是否啟用歸檔模式
 ARCHIVE_AFTER_DAYS = 7                  # 多少天後轉為歸檔格式
@@ -56,6 +77,7 @@ MANUAL_BASELINE_TARGET = []
 LOG_FOLDER = r"C:\Users\user\Desktop\watchdog\log_folder"
 LOG_FILE_DATE = datetime.now().strftime('%Y%m%d')
 CSV_LOG_FILE = os.path.join(LOG_FOLDER, f"excel_change_log_{LOG_FILE_DATE}.csv.gz")
+CSV_LOG_COMPRESSION_LEVEL = 1  # CSV 記錄檔 gzip 壓縮等級 1-9；記錄以小量追加為主，1 已足夠且最省 CPU
 SUPPORTED_EXTS = ('.xlsx', '.xlsm')
 MAX_RETRY = 10
 RETRY_INTERVAL_SEC = 2
@@ -73,6 +95,7 @@ DENSE_POLLING_INTERVAL_SEC = 10
 DENSE_POLLING_DURATION_SEC = 15
 SPARSE_POLLING_INTERVAL_SEC = 15
 SPARSE_POLLING_DURATION_SEC = 15
+POLL_WORKERS = 4  # 同時執行輪詢比較的工作執行緒數目（排程不受慢檔案影響）
 
 # =========== 全局變數 ============
 current_processing_file = None
@@ -2,25 +2,35 @@
 基準線管理功能 - 支援 LZ4、Zstd 和 gzip 壓縮
 """
 import os
+import sys
+import atexit
 import json
 import gzip
 import shutil
 import time
 import gc
+import queue
 import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 import logging
 import config.settings as settings
-from utils.helpers import save_progress, load_progress
-from utils.memory import check_memory_limit, get_memory_usage
+from utils.helpers import save_progress, load_progress, get_file_signature, get_file_raw_hash, timeout_handler
+from utils.memory import check_memory_limit, get_memory_usage, register_memory_release_handler
 from utils.compression import (
     CompressionFormat, 
     save_compressed_file, 
     load_compressed_file,
+    resolve_compressed_file,
     get_compression_stats,
-    migrate_baseline_format
+    migrate_baseline_format,
+    replace_file_with_retry,
+    create_temp_file,
+    get_format_search_order
 )
-from core.excel_parser import dump_excel_cells_with_timeout, hash_excel_content, get_excel_last_author
+from core.excel_parser import dump_excel_cells_with_timeout, hash_excel_sheets, get_excel_last_author
 
 def baseline_file_path(base_name):
     """
@@ -28,21 +38,225 @@ def baseline_file_path(base_name):
     """
     return os.path.join(settings.LOG_FOLDER, f"{base_name}.baseline.json")
 
-def get_baseline_file_with_extension(base_name):
+def baseline_meta_file_path(base_path):
+    """
+    獲取基準線 meta 檔案路徑（只含 last_author / content_hash / timestamp 的小檔案）
+    """
+    if base_path.endswith('.json'):
+        base_path = base_path[:-len('.json')]
+    return base_path + '.meta.json'
+
+def load_baseline_meta(base_path):
+    """
+    載入基準線 meta 檔案，不存在時回傳 None
+    """
+    try:
+        with open(baseline_meta_file_path(base_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (PermissionError, OSError, json.JSONDecodeError) as e:
+        logging.warning(f"載入基準線 meta 失敗 {base_path}: {e}")
+        return None
+
+def load_baseline_header(base_name):
+    """
+    只取得基準線的 last_author / content_hash / timestamp / file_sig，用於判斷內容是否改變；
+    有 meta 檔案時毋須解壓及解析整份 cells，沒有時才退回載入完整基準線
+    """
+    base_path = baseline_file_path(base_name)
+    pending = _get_pending_baseline(base_path)
+    if pending is not None:
+        return pending
+    meta = load_baseline_meta(base_path)
+    if meta is not None and 'content_hash' in meta:
+        return meta
+    return load_baseline(base_name)
+
+def save_baseline_meta_only(base_name, last_author, content_hash, file_sig=None, raw_hash=None):
+    """
+    只更新基準線 meta 檔案 - 內容雜湊不變但最後作者或檔案簽名改變時使用，
+    毋須重新序列化及壓縮整份 cells
+    """
+    return _write_baseline_meta(baseline_file_path(base_name), last_author, content_hash, file_sig, raw_hash)
+
+def _write_baseline_meta(base_path, last_author, content_hash, file_sig=None, raw_hash=None):
+    """
+    寫入 meta 檔案（先寫臨時檔再原子取代）
+    """
+    meta_file = baseline_meta_file_path(base_path)
+    meta = {
+        "last_author": last_author,
+        "content_hash": content_hash,
+        "timestamp": datetime.now().isoformat(timespec='seconds')
+    }
+    if file_sig is not None:
+        meta["file_sig"] = file_sig
+    if raw_hash is not None:
+        meta["raw_hash"] = raw_hash
+    temp_file = None
+    try:
+        os.makedirs(os.path.dirname(meta_file), exist_ok=True)
+        # 觀察者、輪詢及延遲寫入線程可能同時寫入同一個 meta，各自使用唯一的臨時檔
+        fd, temp_file = create_temp_file(meta_file)
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        replace_file_with_retry(temp_file, meta_file)
+        return True
+    except (PermissionError, OSError) as e:
+        logging.error(f"保存基準線 meta 失敗: {e}")
+        if temp_file is not None:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+        return False
+
+def build_baseline_index():
+    """
+    以單次 os.scandir 建立基準線目錄索引 {檔名: 完整路徑}，
+    取代逐個檔案、逐個副檔名的 os.path.exists 查詢
+    """
+    baseline_index = {}
+    try:
+        with os.scandir(settings.LOG_FOLDER) as it:
+            for entry in it:
+                if '.baseline.json' in entry.name and entry.is_file():
+                    baseline_index[entry.name] = entry.path
+    except FileNotFoundError:
+        pass
+    return baseline_index
+
+def get_baseline_file_with_extension(base_name, baseline_index=None):
     """
     獲取實際存在的基準線檔案路徑（包含副檔名）
+    
+    提供 baseline_index 時直接查索引，不再對每個副檔名呼叫 os.path.exists
     """
     base_path = baseline_file_path(base_name)
     
     # 按優先順序檢查不同格式的檔案
-    for format_type in [settings.DEFAULT_COMPRESSION_FORMAT, 'lz4', 'zstd', 'gzip']:
-        ext = CompressionFormat.get_extension(format_type)
+    for _, ext in get_format_search_order(settings.DEFAULT_COMPRESSION_FORMAT):
         test_path = base_path + ext
-        if os.path.exists(test_path):
+        if baseline_index is not None:
+            indexed_path = baseline_index.get(os.path.basename(test_path))
+            if indexed_path:
+                return indexed_path
+        elif os.path.exists(test_path):
             return test_path
     
     return None
 
+def update_baseline_index(baseline_index, base_name):
+    """
+    保存基準線後更新索引：save_baseline 只保留目前格式的檔案
+    """
+    base_path = baseline_file_path(base_name)
+    file_prefix = os.path.basename(base_path)
+    search_order = get_format_search_order(settings.DEFAULT_COMPRESSION_FORMAT)
+    for _, ext in search_order:
+        baseline_index.pop(file_prefix + ext, None)
+    baseline_index[file_prefix + search_order[0][1]] = base_path + search_order[0][1]
+
+# 以平行陣列儲存 cells 時寫入基準線的標記
+CELLS_LAYOUT_SOA = 'soa'
+
+def _cells_to_soa(cells):
+    """
+    {工作表: {地址: {"formula", "value"}}} 轉為每工作表的平行陣列
+    {工作表: {"addrs": [...], "values": [...], "formulas": [...]}}
+    """
+    soa = {}
+    for ws_name, ws_cells in cells.items():
+        addrs = list(ws_cells)
+        cell_dicts = list(ws_cells.values())
+        soa[ws_name] = {
+            "addrs": addrs,
+            "values": [cell.get("value") for cell in cell_dicts],
+            "formulas": [cell.get("formula") for cell in cell_dicts]
+        }
+    return soa
+
+def _cells_from_soa(soa):
+    """
+    _cells_to_soa 的反向轉換，還原為原本每格一個字典的結構
+    """
+    # 地址及工作表名稱在每次比較中大量重複，intern 後共用同一字串物件，
+    # 與 Excel 解析結果比較時字典查找可直接以物件身份命中
+    cells = {}
+    for ws_name, columns in soa.items():
+        cells[sys.intern(ws_name)] = {
+            addr: {"formula": formula, "value": value}
+            for addr, value, formula in zip(map(sys.intern, columns["addrs"]), columns["values"], columns["formulas"])
+        }
+    return cells
+
+# 已解析基準線的快取：base_path -> ((實際檔案, 檔案簽名), data)；輪詢時同一基準線毋須重複解壓及解析
+# 份數受 BASELINE_CACHE_SIZE 限制，總大小（以壓縮後檔案大小估算）受 BASELINE_CACHE_MAX_MB 限制
+_baseline_cache = OrderedDict()
+_baseline_cache_bytes = 0
+_baseline_cache_lock = threading.Lock()
+
+def _load_baseline_cached(base_path):
+    """
+    讀取並還原基準線內容（未合併 meta），檔案未改動時直接使用快取
+    回傳的 dict 是淺複製，呼叫者可修改頂層鍵，但 cells 為共用物件，勿修改
+    """
+    global _baseline_cache_bytes
+    cache_size = getattr(settings, 'BASELINE_CACHE_SIZE', 0)
+    if cache_size <= 0:
+        data = load_compressed_file(base_path)
+        if data is not None and data.pop('cells_layout', None) == CELLS_LAYOUT_SOA:
+            data['cells'] = _cells_from_soa(data.get('cells', {}))
+        return data
+
+    resolved_file = resolve_compressed_file(base_path)
+    if resolved_file is None:
+        return None
+    key = (resolved_file, get_file_signature(resolved_file))
+    with _baseline_cache_lock:
+        cached = _baseline_cache.get(base_path)
+        if cached is not None and cached[0] == key:
+            _baseline_cache.move_to_end(base_path)
+            return dict(cached[1])
+
+    data = load_compressed_file(base_path, resolved_file)
+    if data is None:
+        return None
+    if data.pop('cells_layout', None) == CELLS_LAYOUT_SOA:
+        data['cells'] = _cells_from_soa(data.get('cells', {}))
+
+    budget_bytes = getattr(settings, 'BASELINE_CACHE_MAX_MB', 0) * 1024 * 1024
+    if key[1] is not None and key[1][0] <= budget_bytes:
+        with _baseline_cache_lock:
+            old_entry = _baseline_cache.pop(base_path, None)
+            if old_entry is not None:
+                _baseline_cache_bytes -= old_entry[0][1][0]
+            _baseline_cache[base_path] = (key, data)
+            _baseline_cache_bytes += key[1][0]
+            while len(_baseline_cache) > cache_size or _baseline_cache_bytes > budget_bytes:
+                _, (evicted_key, _) = _baseline_cache.popitem(last=False)
+                _baseline_cache_bytes -= evicted_key[1][0]
+    return dict(data)
+
+def _invalidate_baseline_cache(base_path):
+    global _baseline_cache_bytes
+    with _baseline_cache_lock:
+        entry = _baseline_cache.pop(base_path, None)
+        if entry is not None:
+            _baseline_cache_bytes -= entry[0][1][0]
+
+def clear_baseline_cache():
+    """
+    清空已解析基準線的快取（記憶體使用量過高時自動呼叫）
+    """
+    global _baseline_cache_bytes
+    with _baseline_cache_lock:
+        _baseline_cache.clear()
+        _baseline_cache_bytes = 0
+
+register_memory_release_handler(clear_baseline_cache)
+
 def load_baseline(baseline_file_or_base_name):
     """
     載入基準線檔案，支援多種壓縮格式
@@ -56,11 +270,24 @@ def load_baseline(baseline_file_or_base_name):
             if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
                 base_path = base_path.rsplit('.', 1)[0]
         
-        # 使用壓縮工具載入
-        from utils.compression import load_compressed_file
-        data = load_compressed_file(base_path)
+        # 尚在延遲寫入的更新比磁碟上的基準線新
+        pending = _get_pending_baseline(base_path)
+        if pending is not None:
+            return pending
+        
+        # 使用壓縮工具載入（檔案未改動時取自記憶體快取）
+        data = _load_baseline_cached(base_path)
         
-        # 移除所有 [DEBUG] 載入基準線的訊息
+        # 如有對應同一內容雜湊的 meta 檔案，以其作者及時間為準
+        if data is not None:
+            meta = load_baseline_meta(base_path)
+            if meta and meta.get('content_hash') == data.get('content_hash'):
+                data['last_author'] = meta.get('last_author')
+                data['timestamp'] = meta.get('timestamp', data.get('timestamp'))
+                if 'file_sig' in meta:
+                    data['file_sig'] = meta['file_sig']
+                if 'raw_hash' in meta:
+                    data['raw_hash'] = meta['raw_hash']
         
         return data
         
@@ -76,10 +303,12 @@ def save_baseline(baseline_file_or_base_name, data):
         # 如果是基準名稱，轉換為檔案路徑
         if not os.path.sep in baseline_file_or_base_name and not baseline_file_or_base_name.endswith('.json'):
             base_path = baseline_file_path(baseline_file_or_base_name)
+            file_label = baseline_file_or_base_name
         else:
             base_path = baseline_file_or_base_name
             if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
                 base_path = base_path.rsplit('.', 1)[0]
+            file_label = os.path.basename(base_path)
         
         # 移除： print(f"[DEBUG] 基準路徑: {base_path}")
         
@@ -87,34 +316,44 @@ def save_baseline(baseline_file_or_base_name, data):
         dir_name = os.path.dirname(base_path)
         os.makedirs(dir_name, exist_ok=True)
         
-        # 使用新的壓縮工具
-        from utils.compression import save_compressed_file, get_compression_stats, CompressionFormat
-        
         # 選擇壓縮格式
         compression_format = settings.DEFAULT_COMPRESSION_FORMAT
         # 移除： print(f"[DEBUG] 使用格式: {compression_format}")
         
-        # 檢查是否需要清理舊格式的檔案
-        for old_format in ['gzip', 'lz4', 'zstd']:
-            if old_format != compression_format:
-                old_ext = CompressionFormat.get_extension(old_format)
-                old_file = base_path + old_ext
-                if os.path.exists(old_file):
-                    try:
-                        os.remove(old_file)
-                    except OSError as e:
-                        logging.warning(f"清理舊檔案失敗: {e}")
+        # 平行陣列格式只用於寫入，不修改呼叫者的字典
+        if settings.USE_SOA_CELLS and isinstance(data.get('cells'), dict):
+            data = dict(data, cells=_cells_to_soa(data['cells']), cells_layout=CELLS_LAYOUT_SOA)
         
-        # 保存新檔案
+        # 保存新檔案（舊內容的快取隨即失效，先釋放記憶體）
         # 移除： print(f"[DEBUG] 開始保存壓縮檔案...")
+        _invalidate_baseline_cache(base_path)
         actual_file = save_compressed_file(base_path, data, compression_format)
         # 移除： print(f"[DEBUG] 保存完成: {actual_file}")
         
+        # 新檔案已原子寫入後才清理其他格式的舊檔案，寫入失敗時舊基準線仍然保留
+        for _, ext in get_format_search_order(compression_format):
+            old_file = base_path + ext
+            if old_file != actual_file:
+                try:
+                    os.remove(old_file)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"清理舊檔案失敗: {e}")
+        
+        # 同步寫入 meta 檔案，之後判斷內容是否改變時只需讀取這個小檔案；
+        # 寫入失敗時刪除舊 meta，避免與新基準線不一致
+        if not _write_baseline_meta(base_path, data.get('last_author'), data.get('content_hash'), data.get('file_sig'), data.get('raw_hash')):
+            try:
+                os.remove(baseline_meta_file_path(base_path))
+            except OSError:
+                pass
+        
         # 簡化壓縮統計顯示
         if settings.SHOW_COMPRESSION_STATS:
             stats = get_compression_stats(actual_file)
             if stats:
-                print(f"基準線保存: {os.path.basename(actual_file)} ({stats['format'].upper()}, {stats['compression_ratio']:.1f}%)")
+                print(f"基準線保存: {file_label} ({stats['format'].upper()}, {stats['compression_ratio']:.1f}%)")
         
         return True
         
@@ -130,22 +369,22 @@ def archive_old_baselines():
         return
     
     try:
-        archive_threshold = datetime.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+        archive_threshold = (datetime.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)).timestamp()
         archive_count = 0
         
-        for filename in os.listdir(settings.LOG_FOLDER):
-            if not filename.endswith('.baseline.json.lz4'):
-                continue
-            
-            filepath = os.path.join(settings.LOG_FOLDER, filename)
-            file_mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-            
-            if file_mtime < archive_threshold:
-                print(f"[ARCHIVE] 歸檔舊基準線: {filename}")
-                new_filepath = migrate_baseline_format(filepath, settings.ARCHIVE_COMPRESSION_FORMAT)
-                if new_filepath:
-                    archive_count += 1
-                    print(f"[ARCHIVE] 完成: {os.path.basename(new_filepath)}")
+        # 單次 scandir 取得名稱及 mtime；先收集再轉換，避免遍歷期間修改目錄
+        with os.scandir(settings.LOG_FOLDER) as entries:
+            old_files = [
+                (entry.name, entry.path) for entry in entries
+                if entry.name.endswith('.baseline.json.lz4') and entry.stat().st_mtime < archive_threshold
+            ]
+        
+        for filename, filepath in old_files:
+            print(f"[ARCHIVE] 歸檔舊基準線: {filename}")
+            new_filepath = migrate_baseline_format(filepath, settings.ARCHIVE_COMPRESSION_FORMAT)
+            if new_filepath:
+                archive_count += 1
+                print(f"[ARCHIVE] 完成: {os.path.basename(new_filepath)}")
         
         if archive_count > 0:
             print(f"[ARCHIVE] 共歸檔了 {archive_count} 個基準線檔案")
@@ -153,6 +392,275 @@ def archive_old_baselines():
     except (OSError, shutil.Error) as e:
         logging.error(f"歸檔過程出錯: {e}")
 
+class BaselineWriter:
+    """
+    背景基準線寫入線程：主線程解析下一個 Excel 的同時，在背景壓縮及寫入上一個基準線
+    """
+    def __init__(self, max_pending=2):
+        # 限制待寫入數量，最多同時持有 max_pending 份 cell 數據
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            base_name, baseline_data = item
+            try:
+                ok = save_baseline(base_name, baseline_data)
+            except Exception as e:
+                logging.error(f"背景寫入基準線失敗 {base_name}: {e}")
+                ok = False
+            self.results.put((base_name, ok))
+            self.pending.task_done()
+
+    def submit(self, base_name, baseline_data):
+        """
+        排入寫入佇列（佇列已滿時會阻塞，直至背景線程追上）
+        """
+        self.pending.put((base_name, baseline_data))
+
+    def completed(self):
+        """
+        取出所有已完成的寫入結果 [(base_name, ok), ...]
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def drain(self):
+        """
+        等待目前佇列中的基準線全部寫入完成（線程繼續運行）
+        """
+        self.pending.join()
+
+    def close(self):
+        """
+        等待所有待寫入的基準線完成並結束線程
+        """
+        self.pending.put(None)
+        self.thread.join()
+
+class DebouncedBaselineSaver:
+    """
+    比較後的基準線更新延遲寫入：同一檔案在 delay_sec 內多次更新時只寫入最後一份；
+    未寫入前，load_baseline / load_baseline_header 會直接取用待寫入的內容
+    """
+    def __init__(self, delay_sec):
+        self.delay_sec = delay_sec
+        self.pending = {}  # base_path -> (base_name, baseline_data, 到期時間)
+        self.condition = threading.Condition()
+        # 背景線程與 flush 不可同時寫入同一份基準線（避免重複寫入同一份內容）
+        self.write_lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, base_name, baseline_data):
+        base_path = baseline_file_path(base_name)
+        with self.condition:
+            self.pending[base_path] = (base_name, baseline_data, time.monotonic() + self.delay_sec)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def get_pending(self, base_path):
+        """
+        取得尚未寫入的基準線（淺複製），沒有時回傳 None
+        """
+        with self.condition:
+            item = self.pending.get(base_path)
+        return dict(item[1]) if item is not None else None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                now = time.monotonic()
+                due = [(path, item) for path, item in self.pending.items() if item[2] <= now]
+                if not due:
+                    self.condition.wait(min(item[2] for item in self.pending.values()) - now)
+                    continue
+            self._write(due)
+
+    def _write(self, items):
+        # 寫入完成後才從待寫入清單移除，期間讀取基準線仍會取得最新內容
+        with self.write_lock:
+            for base_path, item in items:
+                with self.condition:
+                    if self.pending.get(base_path) is not item:
+                        continue  # 已被較新的更新取代或已由 flush 寫入
+                base_name, baseline_data, _ = item
+                try:
+                    ok = save_baseline(base_name, baseline_data)
+                except Exception as e:
+                    logging.error(f"背景寫入基準線失敗 {base_name}: {e}")
+                    ok = False
+                if not ok:
+                    print(f"[WARNING] 基準線更新失敗: {base_name}")
+                with self.condition:
+                    if self.pending.get(base_path) is item:
+                        del self.pending[base_path]
+
+    def flush(self):
+        """
+        立即寫入所有待寫入的基準線（程式結束時呼叫）
+        """
+        with self.condition:
+            items = list(self.pending.items())
+        self._write(items)
+
+_baseline_saver = None
+_baseline_saver_lock = threading.Lock()
+
+def schedule_baseline_save(base_name, baseline_data):
+    """
+    延遲寫入基準線（BASELINE_SAVE_DEBOUNCE_SEC 為 0 時即時寫入），回傳是否成功排程/寫入
+    """
+    global _baseline_saver
+    delay_sec = getattr(settings, 'BASELINE_SAVE_DEBOUNCE_SEC', 0)
+    if delay_sec <= 0:
+        return save_baseline(base_name, baseline_data)
+    with _baseline_saver_lock:
+        if _baseline_saver is None:
+            _baseline_saver = DebouncedBaselineSaver(delay_sec)
+    _baseline_saver.submit(base_name, baseline_data)
+    return True
+
+def _get_pending_baseline(base_path):
+    saver = _baseline_saver
+    return saver.get_pending(base_path) if saver is not None else None
+
+def flush_pending_baselines():
+    """
+    寫入所有延遲中的基準線更新
+    """
+    saver = _baseline_saver
+    if saver is not None:
+        saver.flush()
+
+atexit.register(flush_pending_baselines)
+
+# 每處理多少個檔案做一次完整垃圾回收
+GC_COLLECT_INTERVAL = 50
+
+# 每處理多少個檔案寫一次進度檔（停止/中斷時另外即時寫入）；
+# 續傳時最多重做這麼多個檔案，而內容未變的檔案會按雜湊跳過
+PROGRESS_SAVE_INTERVAL = 10
+
+# 子進程需要沿用的執行期設定（Windows 使用 spawn，子進程不會繼承主進程修改過的設定）
+_WORKER_SETTINGS = (
+    'LOG_FOLDER', 'CACHE_FOLDER', 'USE_LOCAL_CACHE', 'DEFAULT_COMPRESSION_FORMAT',
+    'SHOW_COMPRESSION_STATS', 'ENABLE_MEMORY_MONITOR', 'MEMORY_LIMIT_MB', 'USE_SOA_CELLS',
+    'USE_DIRECT_XML_READER', 'RAW_HASH_PRECHECK'
+)
+
+def _init_baseline_worker(settings_snapshot):
+    """
+    進程池初始化：套用主進程的執行期設定
+    """
+    for key, value in settings_snapshot.items():
+        setattr(settings, key, value)
+    # 並行已由多個進程提供，每個子進程的 Zstd 壓縮只用單線程，避免 CPU 超額使用
+    settings.ZSTD_THREADS = 0
+
+def _process_baseline_file(file_path):
+    """
+    在子進程中為單一檔案建立基準線
+
+    Returns:
+        (狀態 'ok'/'skip'/'error', 結果訊息, 原始大小, 壓縮大小)
+    """
+    base_name = os.path.basename(file_path)
+    if check_memory_limit():
+        return 'error', '[MEMORY_LIMIT] 記憶體使用量過高', 0, 0
+    
+    try:
+        old_baseline = load_baseline_header(base_name)
+        old_hash = old_baseline.get('content_hash') if old_baseline else None
+        
+        # 讀取前先取得檔案簽名，讀取期間被修改時下次比較不會誤判為未改動
+        file_sig = get_file_signature(file_path)
+        raw_hash = get_file_raw_hash(file_path) if settings.RAW_HASH_PRECHECK else None
+        cell_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True)
+        if cell_data is None:
+            return 'error', '[READ_ERROR]', 0, 0
+        
+        curr_hash, sheet_hashes = hash_excel_sheets(cell_data)
+        curr_author = get_excel_last_author(file_path)
+        if old_hash == curr_hash and old_hash is not None:
+            author_changed = curr_author != old_baseline.get('last_author')
+            if author_changed or file_sig != old_baseline.get('file_sig'):
+                if save_baseline_meta_only(base_name, curr_author, curr_hash, file_sig, raw_hash) and author_changed:
+                    return 'skip', f'[SKIP] (Hash unchanged, 已更新作者: {curr_author})', 0, 0
+            return 'skip', '[SKIP] (Hash unchanged)', 0, 0
+        
+        baseline_data = {
+            "last_author": curr_author,
+            "content_hash": curr_hash,
+            "sheet_hashes": sheet_hashes,
+            "file_sig": file_sig,
+            "raw_hash": raw_hash,
+            "cells": cell_data
+        }
+        if not save_baseline(base_name, baseline_data):
+            return 'error', '[SAVE_ERROR]', 0, 0
+        
+        original_size, compressed_size = 0, 0
+        if settings.SHOW_COMPRESSION_STATS:
+            actual_file = get_baseline_file_with_extension(base_name)
+            stats = get_compression_stats(actual_file) if actual_file else None
+            if stats and stats['original_size']:
+                original_size, compressed_size = stats['original_size'], stats['compressed_size']
+        return 'ok', '[OK]', original_size, compressed_size
+    
+    except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
+        return 'error', f'[UNEXPECTED_ERROR] {e}', 0, 0
+
+def _create_baselines_in_process_pool(xlsx_files, start_index, total):
+    """
+    以進程池並行建立基準線，進度由主進程按完成順序記錄
+
+    Returns:
+        (成功數, 跳過數, 失敗數, 原始總大小, 壓縮總大小)
+    """
+    counts = {'ok': 0, 'skip': 0, 'error': 0}
+    total_original_size, total_compressed_size = 0, 0
+    
+    workers = min(settings.BASELINE_WORKERS, total - start_index)
+    settings_snapshot = {key: getattr(settings, key) for key in _WORKER_SETTINGS}
+    print(f"⚡ 使用 {workers} 個進程並行建立基準線")
+    
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_baseline_worker, initargs=(settings_snapshot,))
+    completed = start_index
+    try:
+        results = executor.map(_process_baseline_file, xlsx_files[start_index:total], chunksize=1)
+        for i, (status, message, original_size, compressed_size) in enumerate(results, start_index):
+            print(f"[{i+1:>2}/{total}] {os.path.basename(xlsx_files[i])} 結果: {message}")
+            counts[status] += 1
+            total_original_size += original_size
+            total_compressed_size += compressed_size
+            completed = i + 1
+            if completed % PROGRESS_SAVE_INTERVAL == 0:
+                save_progress(completed, total)
+            
+            if settings.force_stop:
+                print("\n🛑 收到停止信號，正在安全退出...")
+                break
+    except BrokenProcessPool as e:
+        logging.error(f"基準線進程池異常終止: {e}")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        save_progress(completed, total)
+    
+    return counts['ok'], counts['skip'], counts['error'], total_original_size, total_compressed_size
+
 def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     """
     為多個檔案建立基準線
@@ -171,8 +679,9 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     print(f"🚀 使用壓縮格式: {settings.DEFAULT_COMPRESSION_FORMAT.upper()}")
     
     if settings.DEFAULT_COMPRESSION_FORMAT not in available_formats:
-        print(f"⚠️  警告: 預設格式 {settings.DEFAULT_COMPRESSION_FORMAT} 不可用，降級到 gzip")
-        settings.DEFAULT_COMPRESSION_FORMAT = 'gzip'
+        fallback_format = CompressionFormat.validate_format(settings.DEFAULT_COMPRESSION_FORMAT)
+        print(f"⚠️  警告: 預設格式 {settings.DEFAULT_COMPRESSION_FORMAT} 不可用，降級到 {fallback_format}")
+        settings.DEFAULT_COMPRESSION_FORMAT = fallback_format
     
     progress = load_progress()
     start_index = 0
@@ -184,7 +693,6 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     
     # 啟動超時處理
     if settings.ENABLE_TIMEOUT:
-        from utils.helpers import timeout_handler
         timeout_thread = threading.Thread(target=timeout_handler, daemon=True)
         timeout_thread.start()
         print(f"⏰ 啟用超時保護: {settings.FILE_TIMEOUT_SECONDS} 秒")
@@ -205,87 +713,139 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     if settings.USE_LOCAL_CACHE: 
         os.makedirs(settings.CACHE_FOLDER, exist_ok=True)
     
+    # 一次過掃描基準線目錄，避免每個檔案多次 os.path.exists
+    baseline_index = build_baseline_index()
+    
     success_count, skip_count, error_count = 0, 0, 0
     start_time = time.time()
     total_original_size = 0
     total_compressed_size = 0
     
-    for i in range(start_index, total):
-        if settings.force_stop:
-            print("\n🛑 收到停止信號，正在安全退出...")
-            save_progress(i, total)
-            break
+    if settings.BASELINE_WORKERS > 1 and total - start_index > 1:
+        # 多進程並行：每個子進程獨立完成解析、雜湊、壓縮及寫入
+        pool_counts = _create_baselines_in_process_pool(xlsx_files, start_index, total)
+        success_count, skip_count, error_count, total_original_size, total_compressed_size = pool_counts
+    else:
+        # Excel 解析（CPU）與壓縮寫入（I/O）重疊進行
+        writer = BaselineWriter()
         
-        file_path = xlsx_files[i]
-        base_name = os.path.basename(file_path)
+        def collect_write_results():
+            nonlocal success_count, error_count, total_original_size, total_compressed_size
+            for written_name, ok in writer.completed():
+                if not ok:
+                    print(f"  ❌ 基準線寫入失敗: {written_name} [SAVE_ERROR]")
+                    error_count += 1
+                    continue
+                print(f"  ✅ 基準線已寫入: {written_name}")
+                success_count += 1
+                update_baseline_index(baseline_index, written_name)
+            
+                # 統計壓縮效果
+                if settings.SHOW_COMPRESSION_STATS:
+                    actual_file = get_baseline_file_with_extension(written_name, baseline_index)
+                    if actual_file:
+                        stats = get_compression_stats(actual_file)
+                        if stats and stats['original_size']:
+                            total_original_size += stats['original_size']
+                            total_compressed_size += stats['compressed_size']
+    
+        def save_progress_after_writes(completed):
+            # 進度只可包含已確認寫入的基準線，中斷後續傳時才不會漏掉仍在佇列中的檔案
+            writer.drain()
+            collect_write_results()
+            save_progress(completed, total)
+
+        for i in range(start_index, total):
+            collect_write_results()
         
-        if check_memory_limit():
-            print(f"⚠️ 記憶體使用量過高，暫停10秒...")
-            time.sleep(10)
-            if check_memory_limit(): 
-                print(f"❌ 記憶體仍然過高，停止處理")
-                save_progress(i, total)
+            if settings.force_stop:
+                print("\n🛑 收到停止信號，正在安全退出...")
+                save_progress_after_writes(i)
                 break
+        
+            file_path = xlsx_files[i]
+            base_name = os.path.basename(file_path)
+        
+            if check_memory_limit():
+                print(f"⚠️ 記憶體使用量過高，暫停10秒...")
+                time.sleep(10)
+                if check_memory_limit(): 
+                    print(f"❌ 記憶體仍然過高，停止處理")
+                    save_progress_after_writes(i)
+                    break
 
-        file_start_time = time.time()
-        print(f"[{i+1:>2}/{total}] 處理中: {base_name} (記憶體: {get_memory_usage():.1f}MB)")
+            file_start_time = time.perf_counter()
+            print(f"[{i+1:>2}/{total}] 處理中: {base_name} (記憶體: {get_memory_usage():.1f}MB)")
         
-        cell_data = None
-        try:
-            old_baseline = load_baseline(base_name)
-            old_hash = old_baseline['content_hash'] if old_baseline and 'content_hash' in old_baseline else None
+            cell_data = None
+            try:
+                # 索引中沒有基準線檔案時，毋須嘗試載入
+                if get_baseline_file_with_extension(base_name, baseline_index):
+                    old_baseline = load_baseline_header(base_name)
+                else:
+                    old_baseline = None
+                old_hash = old_baseline['content_hash'] if old_baseline and 'content_hash' in old_baseline else None
             
-            cell_data = dump_excel_cells_with_timeout(file_path)
+                # 讀取前先取得檔案簽名，讀取期間被修改時下次比較不會誤判為未改動
+                file_sig = get_file_signature(file_path)
+                raw_hash = get_file_raw_hash(file_path) if settings.RAW_HASH_PRECHECK else None
+                cell_data = dump_excel_cells_with_timeout(file_path)
             
-            if cell_data is None:
-                if settings.current_processing_file is None and (time.time() - file_start_time) > settings.FILE_TIMEOUT_SECONDS:
-                     print(f"  結果: [TIMEOUT]")
-                else:
-                     print(f"  結果: [READ_ERROR]")
-                error_count += 1
-            else:
-                curr_hash = hash_excel_content(cell_data)
-                if old_hash == curr_hash and old_hash is not None:
-                    print(f"  結果: [SKIP] (Hash unchanged)")
-                    skip_count += 1
+                if cell_data is None:
+                    if settings.current_processing_file is None and (time.perf_counter() - file_start_time) > settings.FILE_TIMEOUT_SECONDS:
+                         print(f"  結果: [TIMEOUT]")
+                    else:
+                         print(f"  結果: [READ_ERROR]")
+                    error_count += 1
                 else:
-                    curr_author = get_excel_last_author(file_path)
-                    baseline_data = {
-                        "last_author": curr_author, 
-                        "content_hash": curr_hash, 
-                        "cells": cell_data
-                    }
-                    
-                    if save_baseline(base_name, baseline_data):
-                        print(f"  結果: [OK]")
-                        success_count += 1
-                        
-                        # 統計壓縮效果
-                        if settings.SHOW_COMPRESSION_STATS:
-                            actual_file = get_baseline_file_with_extension(base_name)
-                            if actual_file:
-                                stats = get_compression_stats(actual_file)
-                                if stats and stats['original_size']:
-                                    total_original_size += stats['original_size']
-                                    total_compressed_size += stats['compressed_size']
+                    curr_hash, sheet_hashes = hash_excel_sheets(cell_data)
+                    if old_hash == curr_hash and old_hash is not None:
+                        # 內容不變但作者或檔案簽名改變時，只更新細小的 meta 檔案
+                        curr_author = get_excel_last_author(file_path)
+                        author_changed = curr_author != old_baseline.get('last_author')
+                        meta_saved = False
+                        if author_changed or file_sig != old_baseline.get('file_sig'):
+                            meta_saved = save_baseline_meta_only(base_name, curr_author, curr_hash, file_sig, raw_hash)
+                        if author_changed and meta_saved:
+                            print(f"  結果: [SKIP] (Hash unchanged, 已更新作者: {curr_author})")
+                        else:
+                            print(f"  結果: [SKIP] (Hash unchanged)")
+                        skip_count += 1
                     else:
-                        print(f"  結果: [SAVE_ERROR]")
-                        error_count += 1
+                        curr_author = get_excel_last_author(file_path)
+                        baseline_data = {
+                            "last_author": curr_author, 
+                            "content_hash": curr_hash, 
+                            "sheet_hashes": sheet_hashes,
+                            "file_sig": file_sig,
+                            "raw_hash": raw_hash,
+                            "cells": cell_data
+                        }
+                    
+                        writer.submit(base_name, baseline_data)
+                        print(f"  結果: [QUEUED] (已排入背景寫入，完成後另行顯示結果)")
             
-            print(f"  耗時: {time.time() - file_start_time:.2f} 秒")
-            print("")
-            save_progress(i + 1, total)
+                print(f"  耗時: {time.perf_counter() - file_start_time:.2f} 秒")
+                print("")
             
-        except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
-            logging.error(f"  結果: [UNEXPECTED_ERROR]\n  錯誤: {e}\n  耗時: {time.time() - file_start_time:.2f} 秒\n")
-            error_count += 1
-            save_progress(i + 1, total)
-        finally:
-            if cell_data is not None: 
-                del cell_data
-            if 'old_baseline' in locals() and old_baseline is not None: 
-                del old_baseline
-            gc.collect()
+            except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
+                logging.error(f"  結果: [UNEXPECTED_ERROR]\n  錯誤: {e}\n  耗時: {time.perf_counter() - file_start_time:.2f} 秒\n")
+                error_count += 1
+            finally:
+                if (i + 1) % PROGRESS_SAVE_INTERVAL == 0:
+                    save_progress_after_writes(i + 1)
+                if cell_data is not None: 
+                    del cell_data
+                if 'old_baseline' in locals() and old_baseline is not None: 
+                    del old_baseline
+                # cell 數據是無循環參照的字典樹，del 後即由引用計數釋放；
+                # 只需定期做一次完整回收處理零星的循環參照
+                if (i + 1) % GC_COLLECT_INTERVAL == 0:
+                    gc.collect(generation=2)
+
+        # 等待背景寫入全部完成
+        writer.close()
+        collect_write_results()
 
     # 執行歸檔
     if settings.ENABLE_ARCHIVE_MODE:
@@ -1,76 +1,232 @@
 """
 比較和差異顯示功能 - 確保 TABLE 一定顯示
 """
+import io
 import os
+import sys
 import csv
 import gzip
 import json
 import time
+import heapq
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from operator import itemgetter, ne
+from itertools import accumulate, compress
 from datetime import datetime
-from wcwidth import wcwidth
 import config.settings as settings
-from utils.logging import _get_display_width
-from utils.helpers import get_file_mtime
-from core.excel_parser import pretty_formula, extract_external_refs, get_excel_last_author
-from core.baseline import load_baseline, baseline_file_path
+from utils.logging import _get_display_width, char_width, char_widths
+from utils.helpers import get_file_mtime, get_file_signature, get_file_raw_hash, now_str
+from core.excel_parser import pretty_formula, extract_external_refs, get_excel_last_author, dump_excel_cells_with_timeout, hash_excel_sheets
+from core.baseline import load_baseline, load_baseline_header, save_baseline_meta_only, schedule_baseline_save, baseline_file_path
 import logging
 
-# ... [print_aligned_console_diff 和其他輔助函數保持不變] ...
-def print_aligned_console_diff(old_data, new_data, file_info=None, max_display_changes=0):
+# 只快取短文字：輪詢時重複出現的多為地址及短數值，長文字放入快取只會佔用大量記憶體
+_WRAP_CACHE_MAX_LEN = 256
+
+def wrap_text(text, width):
     """
-    三欄式顯示，能處理中英文對齊，並正確顯示 formula。
-    Address 欄固定闊度，Baseline/Current 平均分配。
+    按顯示闊度換行，回傳 tuple；
+    輪詢時同一檔案反覆比較，地址及數值大多重複，短文字的結果以 LRU 快取
     """
-    try:
-        term_width = os.get_terminal_size().columns
-    except OSError:
-        term_width = 120
+    text = str(text)
+    if len(text) <= _WRAP_CACHE_MAX_LEN:
+        return _wrap_text_cached(text, width)
+    return _wrap_text(text, width)
+
+def _wrap_text(text, width):
+    if not text.isprintable():
+        # 移除控制字元（顯示闊度 -1）
+        text = ''.join(char for char in text if char_width(char) >= 0)
+
+    width = max(width, 1)
+    if len(text) * 2 <= width:
+        # 每字元最多佔 2 格，短文字毋須計算闊度
+        return (text,) if text else ('',)
+    if text.isascii():
+        # 已移除控制字元，ASCII 每字元闊度必為 1，直接按字元數切割
+        return tuple(text[k:k + width] for k in range(0, len(text), width)) or ('',)
+
+    widths = char_widths(text)
+    if sum(widths) <= width:
+        # 中文短句常見：整段放得下就毋須建立前綴表
+        return (text,)
+
+    # 一次算出前綴闊度，每行以二分搜尋找出最後一個放得下的位置
+    prefix = list(accumulate(widths, initial=0))
+    lines = []
+    i, n = 0, len(text)
+    while i < n:
+        j = bisect_right(prefix, prefix[i] + width, i + 1) - 1
+        if j == i:
+            j = i + 1  # 單一字元已比欄寬闊
+        lines.append(text[i:j])
+        i = j
+    return tuple(lines) or ('',)
+
+_wrap_text_cached = lru_cache(maxsize=8192)(_wrap_text)
+
+def wrap_and_pad(text, width):
+    """
+    換行並把每行補齊至欄寬：換行時已算出的字元闊度直接用於補齊，毋須每行重新量度；
+    短文字的結果以 LRU 快取
+    """
+    text = str(text)
+    if len(text) <= _WRAP_CACHE_MAX_LEN:
+        return _wrap_and_pad_cached(text, width)
+    return _wrap_and_pad(text, width)
+
+def _wrap_and_pad(text, width):
+    if not text.isascii() and ('\u200d' in text or '\ufe0f' in text):
+        # 零寬連接符 / VS16 組合的闊度須整段交由 wcswidth 計算
+        return tuple(pad_line(line, width) for line in wrap_text(text, width))
+    if not text.isprintable():
+        text = ''.join(char for char in text if char_width(char) >= 0)
+
+    width = max(width, 1)
+    if text.isascii():
+        return tuple(text[k:k + width].ljust(width) for k in range(0, len(text), width)) or (' ' * width,)
+
+    prefix = list(accumulate(char_widths(text), initial=0))
+    if prefix[-1] <= width:
+        return (text + ' ' * (width - prefix[-1]),)
 
+    # 與 wrap_text 相同的二分搜尋換行，每行闊度由前綴表相減得出
+    lines = []
+    i, n = 0, len(text)
+    while i < n:
+        j = bisect_right(prefix, prefix[i] + width, i + 1) - 1
+        if j == i:
+            j = i + 1  # 單一字元已比欄寬闊
+        padding = width - (prefix[j] - prefix[i])
+        lines.append(text[i:j] + ' ' * padding if padding > 0 else text[i:j])
+        i = j
+    return tuple(lines)
+
+_wrap_and_pad_cached = lru_cache(maxsize=8192)(_wrap_and_pad)
+
+# 終端機闊度快取 (取得時間, 闊度)：連續顯示多個表格時毋須每次查詢終端機
+_TERM_WIDTH_TTL_SEC = 1.0
+_term_width_cache = (float('-inf'), 120)
+
+def get_terminal_width():
+    """
+    取得終端機闊度（無終端機時為 120），結果快取 _TERM_WIDTH_TTL_SEC 秒
+    """
+    global _term_width_cache
+    now = time.monotonic()
+    checked_at, width = _term_width_cache
+    if now - checked_at > _TERM_WIDTH_TTL_SEC:
+        try:
+            width = os.get_terminal_size().columns
+        except OSError:
+            width = 120
+        _term_width_cache = (now, width)
+    return width
+
+@lru_cache(maxsize=16)
+def _column_widths(term_width):
+    """
+    按終端機闊度計算 (Address, Baseline, Current) 三欄闊度
+    Address 欄固定闊度，Baseline/Current 平均分配
+    """
     address_col_width = 12
     separators_width = 4
     remaining_width = term_width - address_col_width - separators_width
     baseline_col_width = remaining_width // 2
     current_col_width = remaining_width - baseline_col_width
+    return address_col_width, baseline_col_width, current_col_width
 
-    def wrap_text(text, width):
-        lines = []
-        current_line = ""
-        current_width = 0
-        for char in str(text):
-            char_width = wcwidth(char)
-            if char_width < 0:
-                continue
-            if current_width + char_width > width:
-                lines.append(current_line)
-                current_line = char
-                current_width = char_width
-            else:
-                current_line += char
-                current_width += char_width
-        if current_line:
-            lines.append(current_line)
-        return lines or ['']
-
-    def pad_line(line, width):
-        line_width = _get_display_width(line)
-        if line_width is None:
-            line_width = len(str(line))
-        padding = width - line_width
-        return str(line) + ' ' * padding if padding > 0 else str(line)
-
-    def format_cell(cell_value):
-        if cell_value is None or cell_value == {}:
+# 以 (舊值是否缺少) | (新值是否缺少) << 1 查表決定 Current 欄的前綴
+_ROW_BOTH_PRESENT, _ROW_DELETED = 0, 2
+_NEW_TEXT_PREFIX = ("[MOD] ", "[ADD] ", "[DEL] ", "[ADD] ")
+
+def _cell_wcswidth(line):
+    """
+    單行顯示闊度；"(Empty)"、重複公式等會在同一表格內多次出現，短行的結果以 LRU 快取
+    """
+    if len(line) <= _WRAP_CACHE_MAX_LEN:
+        return _cell_wcswidth_cached(line)
+    return _line_display_width(line)
+
+def _line_display_width(line):
+    line_width = _get_display_width(line)
+    if line_width is None or line_width < 0:
+        # 含不可顯示字元（cwcwidth 對未分配碼位亦回傳 -1）時以字元數估算
+        line_width = len(line)
+    return line_width
+
+_cell_wcswidth_cached = lru_cache(maxsize=8192)(_line_display_width)
+
+def pad_line(line, width):
+    line = str(line)
+    if line.isascii():
+        # ASCII 每字元闊度為 1（控制字元亦按字元數估算），直接用 C 實作的 ljust
+        return line.ljust(width)
+    padding = width - _cell_wcswidth(line)
+    return line + ' ' * padding if padding > 0 else line
+
+def format_cell(cell_value):
+    if cell_value is None:
+        return "(Empty)"
+    if isinstance(cell_value, dict):
+        if not cell_value:
             return "(Empty)"
-        if isinstance(cell_value, dict):
-            formula = cell_value.get("formula")
-            if formula:
-                return f"={formula}"
-            if "value" in cell_value:
-                return repr(cell_value["value"])
-        return repr(cell_value)
-    
-    print()
-    print("=" * term_width)
+        formula = cell_value.get("formula")
+        if formula:
+            return f"={formula}"
+        # repr 已按型別分派（int/float 的 repr 即 str），實測逐型別判斷反而較慢；
+        # 這裏只省去 == {} 比較及重複的鍵查找
+        value = cell_value.get("value", _MISSING)
+        if value is not _MISSING:
+            return repr(value)
+    return repr(cell_value)
+
+# ... [print_aligned_console_diff 和其他輔助函數保持不變] ...
+def _use_plain_diff_output():
+    """
+    輸出不是終端機（例如重新導向到檔案）且黑色 console 沒有運行時，
+    對齊排版沒有人看得到，改用 tab 分隔的純文字，省去闊度計算及換行
+    """
+    if not getattr(settings, 'PLAIN_DIFF_WHEN_NO_TTY', False):
+        return False
+    try:
+        if sys.stdout is None or sys.stdout.isatty():
+            return False
+    except (AttributeError, ValueError):
+        return False
+    try:
+        from ui.console import black_console
+    except ImportError:
+        return True
+    return not (black_console and black_console.running)
+
+@lru_cache(maxsize=64)
+def _table_header(term_width, baseline_time, old_author, current_time, new_author):
+    """
+    表格標題行；同一次比較的多個工作表時間及作者相同，結果可快取
+    （作者名稱可能含中文，仍須經 pad_line 按顯示闊度補齊）
+    """
+    address_col_width, baseline_col_width, current_col_width = _column_widths(term_width)
+    header_addr = pad_line("Address", address_col_width)
+    header_base = pad_line(f"Baseline ({baseline_time} by {old_author})", baseline_col_width)
+    header_curr = pad_line(f"Current ({current_time} by {new_author})", current_col_width)
+    return f"{header_addr} | {header_base} | {header_curr}"
+
+def print_aligned_console_diff(old_data, new_data, file_info=None, max_display_changes=0, total_changes=None):
+    """
+    三欄式顯示，能處理中英文對齊，並正確顯示 formula。
+    Address 欄固定闊度，Baseline/Current 平均分配。
+    total_changes：呼叫者已只傳入要顯示的部分時，實際的變更總數（用於截斷提示）
+    """
+    plain = _use_plain_diff_output()
+    term_width = get_terminal_width()
+    address_col_width, baseline_col_width, current_col_width = _column_widths(term_width)
+
+    # 整個表格先放入緩衝，最後一次過輸出（每次 print 都要加時間戳及轉送黑色 console）
+    out = [""]
+    out.append("=" * term_width)
     if file_info:
         filename = file_info.get('filename', 'Unknown')
         worksheet = file_info.get('worksheet', '')
@@ -79,67 +235,90 @@ def print_aligned_console_diff(old_data, new_data, file_info=None, max_display_c
 
         event_str = f"(事件#{event_number}) " if event_number else ""
         caption = f"{event_str}{file_path} [Worksheet: {worksheet}]" if worksheet else f"{event_str}{file_path}"
-        for cap_line in wrap_text(caption, term_width):
-            print(cap_line)
-    print("=" * term_width)
+        out.extend(wrap_text(caption, term_width))
+    out.append("=" * term_width)
 
     baseline_time = file_info.get('baseline_time', 'N/A')
     current_time = file_info.get('current_time', 'N/A')
     old_author = file_info.get('old_author', 'N/A')
     new_author = file_info.get('new_author', 'N/A')
 
-    header_addr = pad_line("Address", address_col_width)
-    header_base = pad_line(f"Baseline ({baseline_time} by {old_author})", baseline_col_width)
-    header_curr = pad_line(f"Current ({current_time} by {new_author})", current_col_width)
-    print(f"{header_addr} | {header_base} | {header_curr}")
-    print("-" * term_width)
+    if plain:
+        out.append(f"Address\tBaseline ({baseline_time} by {old_author})\tCurrent ({current_time} by {new_author})")
+    else:
+        out.append(_table_header(term_width, baseline_time, old_author, current_time, new_author))
+    out.append("-" * term_width)
 
-    all_keys = sorted(list(set(old_data.keys()) | set(new_data.keys())))
+    all_keys = sorted(old_data.keys() | new_data.keys())
     if not all_keys:
-        print("(No cell changes)")
+        out.append("(No cell changes)")
     else:
-        displayed_changes_count = 0
-        for key in all_keys:
-            if max_display_changes > 0 and displayed_changes_count >= max_display_changes:
-                print(f"...(僅顯示前 {max_display_changes} 個變更，總計 {len(all_keys)} 個變更)...")
+        # 迴圈內不變的值先綁定為局部變數
+        out_append = out.append
+        get_old, get_new = old_data.get, new_data.get
+        acw, bcw, ccw = address_col_width, baseline_col_width, current_col_width
+        blank_addr = ' ' * acw
+        blank_base = ' ' * bcw
+        
+        if total_changes is None:
+            total_changes = len(all_keys)
+        truncated = 0 < max_display_changes < total_changes
+        display_keys = all_keys[:max_display_changes] if truncated else all_keys
+        # 表格行數上限（包括換行後的行），避免大量變更時輸出過長的表格
+        max_rows = getattr(settings, 'MAX_DIFF_ROWS', 0)
+        body_start = len(out)
+        omitted = 0
+        for index, key in enumerate(display_keys):
+            if 0 < max_rows <= len(out) - body_start:
+                omitted = len(display_keys) - index
                 break
+            old_val = get_old(key)
+            new_val = get_new(key)
 
-            old_val = old_data.get(key)
-            new_val = new_data.get(key)
-
-            if old_val is not None and new_val is not None:
-                if old_val != new_val:
-                    old_text = format_cell(old_val)
-                    new_text = "[MOD] " + format_cell(new_val)
-                else:
-                    old_text = format_cell(old_val)
-                    new_text = format_cell(new_val)
-            elif old_val is not None:
-                old_text = format_cell(old_val)
+            # format_cell(None) 本身就是 "(Empty)"
+            old_text = format_cell(old_val)
+            kind = (old_val is None) | ((new_val is None) << 1)
+            if kind == _ROW_DELETED:
                 new_text = "[DEL] (Deleted)"
+            elif kind == _ROW_BOTH_PRESENT and old_val == new_val:
+                new_text = format_cell(new_val)
             else:
-                old_text = "(Empty)"
-                new_text = "[ADD] " + format_cell(new_val)
+                new_text = _NEW_TEXT_PREFIX[kind] + format_cell(new_val)
 
-            addr_lines = wrap_text(key, address_col_width)
-            old_lines = wrap_text(old_text, baseline_col_width)
-            new_lines = wrap_text(new_text, current_col_width)
+            if plain:
+                out_append(f"{key}\t{old_text}\t{new_text}")
+                continue
+
+            # 前兩欄要補齊至欄寬，換行及補齊一併完成；最後一欄毋須補齊
+            addr_lines = wrap_and_pad(key, acw)
+            old_lines = wrap_and_pad(old_text, bcw)
+            new_lines = wrap_text(new_text, ccw)
             num_lines = max(len(addr_lines), len(old_lines), len(new_lines))
-            for i in range(num_lines):
-                a_line = addr_lines[i] if i < len(addr_lines) else ""
-                o_line = old_lines[i] if i < len(old_lines) else ""
-                n_line = new_lines[i] if i < len(new_lines) else ""
-                formatted_a = pad_line(a_line, address_col_width)
-                formatted_o = pad_line(o_line, baseline_col_width)
-                formatted_n = n_line
-                print(f"{formatted_a} | {formatted_o} | {formatted_n}")
-            displayed_changes_count += 1
-    print("=" * term_width)
-    print()
+            if num_lines == 1:
+                # 最常見情況：三欄都毋須換行，直接輸出一行
+                out_append(f"{addr_lines[0]} | {old_lines[0]} | {new_lines[0]}")
+            else:
+                for i in range(num_lines):
+                    # 已用完的欄位直接以預先建立的空白補齊
+                    formatted_a = addr_lines[i] if i < len(addr_lines) else blank_addr
+                    formatted_o = old_lines[i] if i < len(old_lines) else blank_base
+                    formatted_n = new_lines[i] if i < len(new_lines) else ""
+                    out_append(f"{formatted_a} | {formatted_o} | {formatted_n}")
+        
+        if omitted:
+            out_append(f"...(表格已達 {max_rows} 行上限，另有 {omitted} 個變更未顯示，完整記錄見 CSV)...")
+        if truncated:
+            out_append(f"...(僅顯示前 {max_display_changes} 個變更，總計 {total_changes} 個變更)...")
+    out.append("=" * term_width)
+    out.append("")
+    print("\n".join(out))
 
 def format_timestamp_for_display(timestamp_str):
     if not timestamp_str or timestamp_str == 'N/A':
         return 'N/A'
+    # 基準線的 ISO 時間戳長度固定 (YYYY-MM-DDTHH:MM:SS[.ffffff])，直接切片
+    if len(timestamp_str) >= 19 and timestamp_str[10] == 'T':
+        return timestamp_str[:10] + ' ' + timestamp_str[11:19]
     try:
         if 'T' in timestamp_str:
             if '.' in timestamp_str:
@@ -153,15 +332,35 @@ def format_timestamp_for_display(timestamp_str):
 def compare_excel_changes(file_path, silent=False, event_number=None, is_polling=False):
     """
     [最終修正版] 統一日誌記錄和顯示邏輯
+
+    Returns:
+        True = 有變更；False = 已讀取並比較，內容無變化；
+        None = 未能讀取或比較（例如 Excel 儲存中仍鎖住檔案），呼叫者不應視為已處理
     """
     try:
-        from core.excel_parser import dump_excel_cells_with_timeout
-        
         base_name = os.path.basename(file_path)
         
-        old_baseline = load_baseline(base_name)
-        if old_baseline is None:
-            old_baseline = {}
+        # 檔案大小及修改時間與建立基準線時相同，內容必然未變，毋須解析 Excel
+        file_sig = get_file_signature(file_path)
+        baseline_header = load_baseline_header(base_name)
+        if file_sig is not None and baseline_header and baseline_header.get('file_sig') == file_sig:
+            if is_polling:
+                print(f"    [輪詢檢查] {base_name} 內容無變化。")
+            return False
+
+        # 只係修改時間改變（例如開啟後無改動再儲存）時，原始位元組雜湊與基準線相同，毋須解析 Excel；
+        # 檔案大小與基準線記錄不同時位元組必然不同，毋須讀取整個檔案計算雜湊
+        baseline_sig = baseline_header.get('file_sig') if baseline_header else None
+        if settings.RAW_HASH_PRECHECK and file_sig is not None and baseline_sig and baseline_sig[0] == file_sig[0]:
+            raw_hash = get_file_raw_hash(file_path)
+        else:
+            raw_hash = None
+        if raw_hash is not None and baseline_header and baseline_header.get('raw_hash') == raw_hash:
+            if baseline_header.get('content_hash'):
+                save_baseline_meta_only(base_name, baseline_header.get('last_author'), baseline_header['content_hash'], file_sig, raw_hash)
+            if is_polling:
+                print(f"    [輪詢檢查] {base_name} 內容無變化。")
+            return False
 
         current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True)
         if not current_data:
@@ -170,16 +369,66 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
             if not current_data:
                 if not silent:
                     print(f"❌ 重試後仍無法讀取檔案: {base_name}")
-                return False
+                return None
+
+        # 內容雜湊與基準線相同即代表內容未變，毋須載入及解壓整份基準線再逐格比較
+        current_hash, current_sheet_hashes = hash_excel_sheets(current_data)
+        if current_hash and baseline_header and baseline_header.get('content_hash') == current_hash:
+            if file_sig is not None and baseline_header.get('file_sig') != file_sig:
+                save_baseline_meta_only(base_name, baseline_header.get('last_author'), current_hash, file_sig, raw_hash)
+            if is_polling:
+                print(f"    [輪詢檢查] {base_name} 內容無變化。")
+            return False
+
+        if baseline_header is not None and 'cells' in baseline_header:
+            old_baseline = baseline_header  # 沒有 meta 檔案時已載入完整基準線
+        else:
+            old_baseline = load_baseline(base_name)
+        if old_baseline is None:
+            old_baseline = {}
         
         baseline_cells = old_baseline.get('cells', {})
-        if baseline_cells == current_data:
+
+        # 每個工作表只深入比較一次，結果同時用於判斷「有否變更」及找出要顯示的工作表
+        # （按活頁簿次序，已刪除的工作表排最後）；靜默模式找到第一個不同的工作表即可停止。
+        # 基準線記有該工作表的雜湊且與現時相同時，毋須逐格比較
+        worksheet_names = list(current_data) + [name for name in baseline_cells if name not in current_data]
+        baseline_sheet_hashes = old_baseline.get('sheet_hashes') or {}
+        current_sheet_hashes = current_sheet_hashes or {}
+        changed_worksheets = (
+            name for name in worksheet_names
+            if not (name in current_sheet_hashes and baseline_sheet_hashes.get(name) == current_sheet_hashes[name])
+            and baseline_cells.get(name, _EMPTY_CELL) != current_data.get(name, _EMPTY_CELL)
+        )
+        if silent:
+            any_sheet_has_changes = next(changed_worksheets, None) is not None
+        else:
+            changed_worksheets = list(changed_worksheets)
+            any_sheet_has_changes = bool(changed_worksheets)
+
+        if not any_sheet_has_changes:
+            if current_hash and old_baseline.get('content_hash') and old_baseline['content_hash'] != current_hash and not silent:
+                # 內容相同但雜湊不同（基準線由舊版雜湊格式建立）：以現時雜湊重寫一次，之後可直接用雜湊判斷
+                refreshed_baseline = dict(old_baseline)
+                refreshed_baseline.update({
+                    "content_hash": current_hash,
+                    "sheet_hashes": current_sheet_hashes,
+                    "file_sig": file_sig,
+                    "raw_hash": raw_hash,
+                    "cells": current_data,
+                })
+                schedule_baseline_save(base_name, refreshed_baseline)
+            elif file_sig is not None and old_baseline.get('content_hash') and old_baseline.get('file_sig') != file_sig:
+                # 記下新的檔案簽名，之後的檢查可直接跳過解析
+                save_baseline_meta_only(base_name, old_baseline.get('last_author'), old_baseline['content_hash'], file_sig, raw_hash)
             # 如果是輪詢且無變化，則不顯示任何內容
             if is_polling:
                 print(f"    [輪詢檢查] {base_name} 內容無變化。")
             return False
         
-        any_sheet_has_changes = False
+        if silent:
+            # 靜默模式只需知道是否有變更（不顯示、不記錄、不更新基準線）
+            return True
         
         old_author = old_baseline.get('last_author', 'N/A')
         try:
@@ -187,48 +436,53 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
         except Exception:
             new_author = 'Unknown'
 
-        for worksheet_name in set(baseline_cells.keys()) | set(current_data.keys()):
+        pending_csv_rows = []
+        csv_timestamp = now_str()
+        # 時間戳每次比較只取一次，所有工作表共用
+        baseline_time_display = format_timestamp_for_display(old_baseline.get('timestamp', 'N/A'))
+        current_time_display = format_timestamp_for_display(get_file_mtime(file_path))
+        
+        for worksheet_name in changed_worksheets:
             old_ws = baseline_cells.get(worksheet_name, {})
             new_ws = current_data.get(worksheet_name, {})
             
-            if old_ws == new_ws:
-                continue
+            # 有變更的儲存格只找一次，顯示及分析共用
+            changed_cells = _diff_worksheet(old_ws, new_ws)
+            # 表格只顯示按地址排序的前 MAX_CHANGES_TO_DISPLAY 項，毋須為其餘變更建立顯示資料
+            max_display = settings.MAX_CHANGES_TO_DISPLAY
+            display_cells = changed_cells
+            if 0 < max_display < len(changed_cells):
+                display_cells = heapq.nsmallest(max_display, changed_cells, key=itemgetter(0))
+            display_old = {addr: old_cell for addr, old_cell, _ in display_cells}
+            display_new = {addr: new_cell for addr, _, new_cell in display_cells}
 
-            any_sheet_has_changes = True
+            # 確保比較表格一定顯示
+            print_aligned_console_diff(
+                display_old,
+                display_new,
+                {
+                    'filename': base_name,
+                    'file_path': file_path,
+                    'event_number': event_number,
+                    'worksheet': worksheet_name,
+                    'baseline_time': baseline_time_display,
+                    'current_time': current_time_display,
+                    'old_author': old_author,
+                    'new_author': new_author,
+                },
+                max_display_changes=max_display,
+                total_changes=len(changed_cells)
+            )
             
-            # 只有在非靜默模式下才顯示和記錄
-            if not silent:
-                baseline_timestamp = old_baseline.get('timestamp', 'N/A')
-                current_timestamp = get_file_mtime(file_path)
-                
-                # 準備顯示的資料
-                all_addresses = set(old_ws.keys()) | set(new_ws.keys())
-                display_old = {addr: old_ws.get(addr) for addr in all_addresses if old_ws.get(addr) != new_ws.get(addr)}
-                display_new = {addr: new_ws.get(addr) for addr in all_addresses if old_ws.get(addr) != new_ws.get(addr)}
-
-                # 確保比較表格一定顯示
-                print_aligned_console_diff(
-                    display_old,
-                    display_new,
-                    {
-                        'filename': base_name,
-                        'file_path': file_path,
-                        'event_number': event_number,
-                        'worksheet': worksheet_name,
-                        'baseline_time': format_timestamp_for_display(baseline_timestamp),
-                        'current_time': format_timestamp_for_display(current_timestamp),
-                        'old_author': old_author,
-                        'new_author': new_author,
-                    },
-                    max_display_changes=settings.MAX_CHANGES_TO_DISPLAY
-                )
-                
-                # 分析並記錄有意義的變更
-                meaningful_changes = analyze_meaningful_changes(old_ws, new_ws)
+            # 分析並記錄有意義的變更：只在非輪詢的第一次檢查時記錄日誌，避免重複；
+            # 輪詢時分析結果不會被使用，毋須分析
+            if not is_polling:
+                meaningful_changes = analyze_meaningful_changes(old_ws, new_ws, changed_cells)
                 if meaningful_changes:
-                    # 只在非輪詢的第一次檢查時記錄日誌，避免重複
-                    if not is_polling:
-                        log_meaningful_changes_to_csv(file_path, worksheet_name, meaningful_changes, new_author)
+                    pending_csv_rows += build_csv_log_rows(file_path, worksheet_name, meaningful_changes, new_author, csv_timestamp)
+
+        # 所有工作表的記錄一次過寫入（整批只 flush 一次 gzip）
+        write_csv_log_rows(pending_csv_rows)
 
         # 只有在非輪詢的第一次檢查且有變更時才更新基準線
         if any_sheet_has_changes and not silent and not is_polling:
@@ -236,12 +490,14 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
                 print(f"🔄 自動更新基準線: {base_name}")
                 updated_baseline = {
                     "last_author": new_author,
-                    "content_hash": f"updated_{int(time.time())}",
+                    "content_hash": current_hash,
+                    "sheet_hashes": current_sheet_hashes,
+                    "file_sig": file_sig,
+                    "raw_hash": raw_hash,
                     "cells": current_data,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(timespec='seconds')
                 }
-                from core.baseline import save_baseline
-                if not save_baseline(base_name, updated_baseline):
+                if not schedule_baseline_save(base_name, updated_baseline):
                     print(f"[WARNING] 基準線更新失敗: {base_name}")
         
         return any_sheet_has_changes
@@ -249,99 +505,197 @@ def compare_excel_changes(file_path, silent=False, event_number=None, is_polling
     except Exception as e:
         if not silent:
             logging.error(f"比較過程出錯: {e}")
-        return False
+        return None
+
+# 新增/刪除儲存格時代表缺少一方的空儲存格（唯讀，勿修改）
+_EMPTY_CELL = {}
+# dict.get 的哨兵值：區分「地址不存在」與儲存格值本身
+_MISSING = object()
 
-def analyze_meaningful_changes(old_ws, new_ws):
+def _diff_worksheet(old_ws, new_ws):
     """
-    🧠 分析有意義的變更
+    找出工作表內有變更的儲存格，回傳 [(地址, 舊儲存格, 新儲存格)]，缺少的一方為 None；
+    每個舊儲存格只查一次新表，新增的地址由集合差得出
+    （實測比先求交集再逐一比較快約 3 倍：交集要為所有地址建立集合，每格亦要多查兩次）
+    """
+    if len(old_ws) == len(new_ws) and list(old_ws) == list(new_ws):
+        # 常見情況：只改了數值，地址及次序完全相同（解析及基準線都按列次序建立）；
+        # 以 map(ne) 配合 compress 在 C 層逐格比較，毋須 Python 迴圈
+        changed_addrs = list(compress(old_ws, map(ne, old_ws.values(), new_ws.values())))
+        return [(addr, old_ws[addr], new_ws[addr]) for addr in changed_addrs]
+
+    changed_cells = []
+    deleted_count = 0
+    get_new_cell = new_ws.get
+    for addr, old_cell in old_ws.items():
+        new_cell = get_new_cell(addr, _MISSING)
+        if new_cell is _MISSING:
+            changed_cells.append((addr, old_cell, None))
+            deleted_count += 1
+        elif old_cell != new_cell:
+            changed_cells.append((addr, old_cell, new_cell))
+    # 新表的地址數目等於舊表仍存在的地址數目時必然沒有新增，毋須建立整個集合差
+    if len(new_ws) != len(old_ws) - deleted_count:
+        changed_cells += [(addr, None, new_ws[addr]) for addr in new_ws.keys() - old_ws.keys()]
+    return changed_cells
+
+def analyze_meaningful_changes(old_ws, new_ws, changed_cells=None):
+    """
+    🧠 分析有意義的變更（changed_cells 為 _diff_worksheet 的結果，已有時毋須重新比較）
     """
     meaningful_changes = []
-    all_addresses = set(old_ws.keys()) | set(new_ws.keys())
+    # 按設定不記錄的變更類型，每次分析只判斷一次
+    ignored_types = set()
+    if not settings.TRACK_FORMULA_CHANGES: ignored_types.add('FORMULA_CHANGE')
+    if not settings.TRACK_DIRECT_VALUE_CHANGES: ignored_types.add('DIRECT_VALUE_CHANGE')
+    if not settings.TRACK_EXTERNAL_REFERENCES: ignored_types.add('EXTERNAL_REF_UPDATE')
+    if settings.IGNORE_INDIRECT_CHANGES: ignored_types.add('INDIRECT_CHANGE')
+    if changed_cells is None:
+        changed_cells = _diff_worksheet(old_ws, new_ws)
     
-    for addr in all_addresses:
-        old_cell = old_ws.get(addr, {})
-        new_cell = new_ws.get(addr, {})
-        
+    for addr, old_cell, new_cell in changed_cells:
+        # 已刪除/新增的地址以共用的空字典代表缺少的一方
+        if old_cell is None:
+            old_cell = _EMPTY_CELL
+        if new_cell is None:
+            new_cell = _EMPTY_CELL
         if old_cell == new_cell:
             continue
 
-        change_type = classify_change_type(old_cell, new_cell)
-        
+        # 每格的值及公式只取一次，分類及記錄共用
+        old_value, old_formula = old_cell.get('value'), old_cell.get('formula')
+        new_value, new_formula = new_cell.get('value'), new_cell.get('formula')
+
         # 根據設定過濾變更
-        if (change_type == 'FORMULA_CHANGE' and not settings.TRACK_FORMULA_CHANGES) or \
-           (change_type == 'DIRECT_VALUE_CHANGE' and not settings.TRACK_DIRECT_VALUE_CHANGES) or \
-           (change_type == 'EXTERNAL_REF_UPDATE' and not settings.TRACK_EXTERNAL_REFERENCES) or \
-           (change_type == 'INDIRECT_CHANGE' and settings.IGNORE_INDIRECT_CHANGES):
+        change_type = _classify_values(bool(old_cell), bool(new_cell), old_value, new_value, old_formula, new_formula)
+        if change_type in ignored_types:
             continue
 
         meaningful_changes.append({
             'address': addr,
-            'old_value': old_cell.get('value'),
-            'new_value': new_cell.get('value'),
-            'old_formula': old_cell.get('formula'),
-            'new_formula': new_cell.get('formula'),
+            'old_value': old_value,
+            'new_value': new_value,
+            'old_formula': old_formula,
+            'new_formula': new_formula,
             'change_type': change_type
         })
     
     return meaningful_changes
 
+def _classify_by_flags(old_present, new_present, formula_changed, value_changed, has_formula):
+    """
+    classify_change_type 的原始判斷次序，只用於建立 _CHANGE_TYPE_TABLE
+    """
+    if not old_present and new_present: return 'CELL_ADDED'
+    if old_present and not new_present: return 'CELL_DELETED'
+    if formula_changed: return 'FORMULA_CHANGE'
+    # 以下公式相同，has_formula 即兩邊都有公式
+    if not has_formula and value_changed: return 'DIRECT_VALUE_CHANGE'
+    if has_formula and value_changed: return _EXTERNAL_OR_INDIRECT
+    return 'NO_CHANGE'
+
+# 需要再檢查外部參照才能決定的類型
+_EXTERNAL_OR_INDIRECT = object()
+
+# 5 個判斷條件編成位元鍵後直接查表，每格毋須逐一走過判斷串
+_CHANGE_TYPE_TABLE = tuple(
+    _classify_by_flags(bool(key & 16), bool(key & 8), bool(key & 4), bool(key & 2), bool(key & 1))
+    for key in range(32)
+)
+
 def classify_change_type(old_cell, new_cell):
     """
     🔍 分類變更類型
     """
-    old_val = old_cell.get('value')
-    new_val = new_cell.get('value')
-    old_formula = old_cell.get('formula')
-    new_formula = new_cell.get('formula')
-    
-    if not old_cell and new_cell: return 'CELL_ADDED'
-    if old_cell and not new_cell: return 'CELL_DELETED'
-    if old_formula != new_formula: return 'FORMULA_CHANGE'
-    if not old_formula and not new_formula and old_val != new_val: return 'DIRECT_VALUE_CHANGE'
-    if old_formula and new_formula and old_formula == new_formula and old_val != new_val:
+    return _classify_values(
+        bool(old_cell), bool(new_cell),
+        old_cell.get('value'), new_cell.get('value'),
+        old_cell.get('formula'), new_cell.get('formula')
+    )
+
+def _classify_values(old_present, new_present, old_val, new_val, old_formula, new_formula):
+    """
+    classify_change_type 的核心，供已取出值及公式的呼叫者直接使用
+    """
+    key = (
+        (old_present << 4)
+        | (new_present << 3)
+        | ((old_formula != new_formula) << 2)
+        | ((old_val != new_val) << 1)
+        | bool(old_formula)
+    )
+    change_type = _CHANGE_TYPE_TABLE[key]
+    if change_type is _EXTERNAL_OR_INDIRECT:
         return 'EXTERNAL_REF_UPDATE' if has_external_reference(old_formula) else 'INDIRECT_CHANGE'
-    return 'NO_CHANGE'
+    return change_type
 
 def has_external_reference(formula):
     if not formula: return False
     return "['" in formula or "!'" in formula
 
+# CSV 變更記錄檔：每批記錄壓縮成一個完整的 gzip member 後附加寫入，
+# 程式異常結束時之前寫入的記錄仍可完整讀取
+_csv_log_lock = threading.Lock()
+
+CSV_LOG_HEADER = [
+    'Timestamp', 'Filename', 'Worksheet', 'Cell', 'Change_Type',
+    'Old_Value', 'New_Value', 'Old_Formula', 'New_Formula', 'Last_Author'
+]
+
 def log_meaningful_changes_to_csv(file_path, worksheet_name, changes, current_author):
     """
     📝 記錄有意義的變更到 CSV (最終統一版)
     """
+    write_csv_log_rows(build_csv_log_rows(file_path, worksheet_name, changes, current_author))
+
+def build_csv_log_rows(file_path, worksheet_name, changes, current_author, timestamp=None):
+    """
+    把一個工作表的有意義變更轉成 CSV 記錄列（未寫入檔案）
+    """
     if not current_author or current_author == 'N/A' or not changes:
-        return
+        return []
+    if timestamp is None:
+        timestamp = now_str()
+    filename = os.path.basename(file_path)
+    return [
+        [
+            timestamp,
+            filename,
+            worksheet_name,
+            change['address'],
+            change['change_type'],
+            change.get('old_value', ''),
+            change.get('new_value', ''),
+            change.get('old_formula', ''),
+            change.get('new_formula', ''),
+            current_author
+        ]
+        for change in changes
+    ]
 
+def write_csv_log_rows(rows):
+    """
+    一次過寫入多列 CSV 記錄（可跨工作表）：整批先以 csv.writer 寫入記憶體，
+    壓縮成一個完整的 gzip member 再附加到記錄檔
+    """
+    if not rows:
+        return
     try:
-        os.makedirs(os.path.dirname(settings.CSV_LOG_FILE), exist_ok=True)
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        file_exists = os.path.exists(settings.CSV_LOG_FILE)
-        
-        with gzip.open(settings.CSV_LOG_FILE, 'at', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f)
-            
-            if not file_exists:
-                writer.writerow([
-                    'Timestamp', 'Filename', 'Worksheet', 'Cell', 'Change_Type',
-                    'Old_Value', 'New_Value', 'Old_Formula', 'New_Formula', 'Last_Author'
-                ])
-            
-            for change in changes:
-                writer.writerow([
-                    timestamp,
-                    os.path.basename(file_path),
-                    worksheet_name,
-                    change['address'],
-                    change['change_type'],
-                    change.get('old_value', ''),
-                    change.get('new_value', ''),
-                    change.get('old_formula', ''),
-                    change.get('new_formula', ''),
-                    current_author
-                ])
+        with _csv_log_lock:
+            log_path = settings.CSV_LOG_FILE
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            buffer = io.StringIO(newline='')
+            writer = csv.writer(buffer)
+            if not os.path.exists(log_path):
+                writer.writerow(CSV_LOG_HEADER)
+            # 一次過交給 C 實作的 writerows
+            # （_csv 的引號處理已在 C 層完成，改用 str.join 手寫並不會更快）
+            writer.writerows(rows)
+            member = gzip.compress(buffer.getvalue().encode('utf-8'), compresslevel=settings.CSV_LOG_COMPRESSION_LEVEL)
+            with open(log_path, 'ab') as f:
+                f.write(member)
         
-        print(f"📝 {len(changes)} 項變更已記錄到 CSV")
+        print(f"📝 {len(rows)} 項變更已記錄到 CSV")
         
     except (OSError, csv.Error) as e:
         logging.error(f"記錄有意義的變-更到 CSV 時發生錯誤: {e}")
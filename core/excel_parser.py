@@ -2,6 +2,7 @@
 Excel 檔案解析功能
 """
 import os
+import sys
 import time
 import zipfile
 import xml.etree.ElementTree as ET
@@ -9,12 +10,79 @@ import re
 import json
 import hashlib
 from datetime import datetime
+from functools import lru_cache
 from openpyxl import load_workbook
 from openpyxl.worksheet.formula import ArrayFormula
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from openpyxl.formula.translate import Translator
 import config.settings as settings
 from utils.cache import copy_to_cache
 import logging
 
+# orjson（Rust 實作）可選：已安裝時用於序列化雜湊內容，否則使用標準 json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+# lxml（C 實作）可選：已安裝時用於解析外部連結 XML，否則使用標準庫 ElementTree
+try:
+    from lxml import etree as lxml_etree
+    HAS_LXML = True
+except ImportError:
+    lxml_etree = None
+    HAS_LXML = False
+
+_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+if HAS_LXML:
+    # XPath 於載入模組時編譯一次；解析器不展開外部實體
+    _xml_parser = lxml_etree.XMLParser(resolve_entities=False, no_network=True)
+    _xpath_relationships = lxml_etree.XPath('r:Relationship', namespaces={'r': _RELATIONSHIPS_NS})
+    _XML_PARSE_ERRORS = (ET.ParseError, lxml_etree.XMLSyntaxError)
+
+    def _parse_xml(data):
+        return lxml_etree.fromstring(data, _xml_parser)
+
+    def _find_relationships(root):
+        return _xpath_relationships(root)
+
+    def _iterparse_start(stream):
+        return lxml_etree.iterparse(stream, events=('start',), resolve_entities=False, no_network=True)
+else:
+    _XML_PARSE_ERRORS = (ET.ParseError,)
+
+    def _parse_xml(data):
+        return ET.fromstring(data)
+
+    def _find_relationships(root):
+        return root.findall(f'{{{_RELATIONSHIPS_NS}}}Relationship')
+
+    def _iterparse_start(stream):
+        return ET.iterparse(stream, events=('start',))
+
+_EXTERNAL_BOOK_PR_TAG = f'{{{_SPREADSHEET_NS}}}externalBookPr'
+
+def _read_external_book_href(z, member):
+    """
+    串流解析外部連結 XML，找到 externalBookPr 即停止，毋須建立整棵樹
+    """
+    with z.open(member) as stream:
+        for _, elem in _iterparse_start(stream):
+            if elem.tag == _EXTERNAL_BOOK_PR_TAG:
+                return elem.attrib.get('href', '')
+    return ''
+
+_EXTERNAL_REF_ERRORS = (zipfile.BadZipFile, KeyError) + _XML_PARSE_ERRORS
+
+# 外部參照相關的正規表達式，於載入模組時編譯一次
+_EXTERNAL_LINK_TARGET_RE = re.compile(r'externalLink(\d+)\.xml')
+_EXTERNAL_REF_RE = re.compile(r'\[(\d+)\][A-Za-z0-9_]+!')
+
 def extract_external_refs(xlsx_path):
     """
     解析 Excel xlsx 中 external reference mapping: [n] -> 路徑
@@ -22,26 +90,19 @@ def extract_external_refs(xlsx_path):
     ref_map = {}
     try:
         with zipfile.ZipFile(xlsx_path, 'r') as z:
-            rels = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
-            for rel in rels.findall('{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
+            rels = _parse_xml(z.read('xl/_rels/workbook.xml.rels'))
+            for rel in _find_relationships(rels):
                 if rel.attrib['Type'].endswith('/externalLink'):
                     target = rel.attrib['Target']
-                    m = re.search(r'externalLink(\d+)\.xml', target)
+                    m = _EXTERNAL_LINK_TARGET_RE.search(target)
                     if m:
                         num = int(m.group(1))
                         try:
-                            link_xml = z.read(f'xl/{target}')
-                            link_tree = ET.fromstring(link_xml)
-                            book_elem = link_tree.find('.//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}externalBookPr')
-                            if book_elem is not None:
-                                path = book_elem.attrib.get('href', '')
-                            else:
-                                path = ''
-                            ref_map[num] = path
-                        except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+                            ref_map[num] = _read_external_book_href(z, f'xl/{target}')
+                        except _EXTERNAL_REF_ERRORS as e:
                             logging.error(f"解析外部連結XML失敗: {target}, 錯誤: {e}")
                             ref_map[num] = ''
-    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+    except _EXTERNAL_REF_ERRORS as e:
         logging.error(f"提取外部參照時發生錯誤: {xlsx_path}, 錯誤: {e}")
     return ref_map
 
@@ -58,7 +119,8 @@ def pretty_formula(formula, ref_map=None):
     else:
         formula_str = str(formula)
     
-    if ref_map:
+    # 沒有 '[' 的公式不可能含外部參照，毋須執行正規表達式
+    if ref_map and '[' in formula_str:
         def repl(m):
             n = int(m.group(1))
             path = ref_map.get(n, '')
@@ -66,7 +128,7 @@ def pretty_formula(formula, ref_map=None):
                 return f"[外部檔案{n}: {path}]{m.group(0)}"
             else:
                 return m.group(0)
-        return re.sub(r'\[(\d+)\][A-Za-z0-9_]+!', repl, formula_str)
+        return _EXTERNAL_REF_RE.sub(repl, formula_str)
     else:
         return formula_str
 
@@ -95,13 +157,26 @@ def serialize_cell_value(value):
         return value
     return str(value)
 
+_CORE_PROPS_LAST_MODIFIED_BY = '{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}lastModifiedBy'
+
+@lru_cache(maxsize=64)
+def _read_last_author(path, size, mtime_ns):
+    """
+    直接讀取 docProps/core.xml 的 lastModifiedBy（與 openpyxl 的 wb.properties 同一來源），
+    毋須載入整個活頁簿；以 (路徑, 大小, 修改時間) 快取，檔案未改動時不再開檔
+    """
+    with zipfile.ZipFile(path, 'r') as z:
+        try:
+            core_xml = z.read('docProps/core.xml')
+        except KeyError:
+            return None
+    elem = ET.fromstring(core_xml).find(_CORE_PROPS_LAST_MODIFIED_BY)
+    return elem.text if elem is not None else None
+
 def get_excel_last_author(path):
     try:
-        wb = load_workbook(path, read_only=True)
-        author = wb.properties.lastModifiedBy
-        wb.close()
-        del wb
-        return author
+        stat = os.stat(path)
+        return _read_last_author(path, stat.st_size, stat.st_mtime_ns)
     except FileNotFoundError:
         logging.warning(f"檔案未找到: {path}")
         return None
@@ -130,6 +205,195 @@ def safe_load_workbook(path, max_retry=5, delay=0.5, **kwargs):
             break
     raise last_err
 
+# 工作表 XML 內嘅公式元素 <f>（含 namespace 前綴及 <f/>），唔會誤中 <fill>、<formula1> 等
+_SHEET_FORMULA_TAG_RE = re.compile(rb'<(?:\w+:)?f[\s/>]')
+_SHEET_PROBE_CHUNK = 1024 * 1024
+
+def _sheet_has_formulas(z, member):
+    """
+    串流掃描工作表 XML 是否含公式；一見到 <f> 即停止。無法判斷時當作有公式處理
+    """
+    try:
+        with z.open(member) as stream:
+            tail = b''
+            while True:
+                chunk = stream.read(_SHEET_PROBE_CHUNK)
+                if not chunk:
+                    return False
+                if _SHEET_FORMULA_TAG_RE.search(tail + chunk):
+                    return True
+                tail = chunk[-16:]
+    except (KeyError, zipfile.BadZipFile, OSError):
+        return True
+
+_column_letters = []
+_PLAIN_VALUE_TYPES = frozenset((int, float, str, bool))
+
+def _get_column_letters(count):
+    """
+    取得第 1 至 count 欄嘅欄字母（index 0 對應 A），按需擴充並重用
+    """
+    if len(_column_letters) < count:
+        _column_letters.extend(get_column_letter(i) for i in range(len(_column_letters) + 1, count + 1))
+    return _column_letters
+
+def _dump_values_only(ws):
+    """
+    無公式工作表：以 values_only 迭代，唔建立 cell 物件，座標由欄字母 + 行號組成
+    """
+    ws_data = {}
+    col_letters = _get_column_letters(ws.max_column or 1)
+    intern = sys.intern
+    plain_types = _PLAIN_VALUE_TYPES
+    for r, row in enumerate(ws.iter_rows(values_only=True), 1):
+        if len(row) > len(col_letters):
+            col_letters = _get_column_letters(len(row))
+        for c, value in enumerate(row):
+            if value is None:
+                continue
+            if type(value) not in plain_types:
+                value = serialize_cell_value(value)
+                if value is None:
+                    continue
+            ws_data[intern(f"{col_letters[c]}{r}")] = {"formula": None, "value": value}
+    return ws_data
+
+_CELL_TAG = f'{{{_SPREADSHEET_NS}}}c'
+_ROW_TAG = f'{{{_SPREADSHEET_NS}}}row'
+_VALUE_TAG = f'{{{_SPREADSHEET_NS}}}v'
+_FORMULA_TAG = f'{{{_SPREADSHEET_NS}}}f'
+_INLINE_STRING_TAG = f'{{{_SPREADSHEET_NS}}}is'
+_TEXT_TAG = f'{{{_SPREADSHEET_NS}}}t'
+_RICH_RUN_TAG = f'{{{_SPREADSHEET_NS}}}r'
+_ROW_DIGITS = '0123456789'
+
+class _DirectReadUnsupported(Exception):
+    """
+    工作表 XML 含直接解析器未處理嘅內容，需改用 openpyxl 讀取
+    """
+
+def _inline_string_text(elem):
+    """
+    取得 inline string 純文字（<t> 加上各 rich text run 嘅 <t>，略過注音 <rPh>）
+    """
+    parts = []
+    plain = elem.find(_TEXT_TAG)
+    if plain is not None and plain.text is not None:
+        parts.append(plain.text)
+    for run in elem.iterfind(_RICH_RUN_TAG):
+        text = run.findtext(_TEXT_TAG)
+        if text is not None:
+            parts.append(text)
+    return ''.join(parts)
+
+def _dump_sheet_xml(z, ws):
+    """
+    直接 iterparse 工作表 XML 提取儲存格，結果與 openpyxl read_only 逐格讀取一致：
+    數字/日期/布林/共用字串轉換、共用公式展開、array formula 只存公式
+    """
+    wb = ws.parent
+    shared_strings = ws._shared_strings
+    date_formats = wb._date_formats
+    timedelta_formats = wb._timedelta_formats
+    epoch = wb.epoch
+    max_row = ws.max_row
+    max_col = ws.max_column
+    max_letters = get_column_letter(max_col) if max_col else None
+    plain_types = _PLAIN_VALUE_TYPES
+    intern = sys.intern
+    shared_formulae = {}
+    ws_data = {}
+
+    # 逐格解析用標準庫 ElementTree（C 加速）：lxml 每個元素都要建立 proxy 物件，喺呢度反而較慢
+    with z.open(ws._worksheet_path) as stream:
+        for _, elem in ET.iterparse(stream, events=('end',)):
+            tag = elem.tag
+            if tag == _ROW_TAG:
+                elem.clear()
+                continue
+            if tag != _CELL_TAG:
+                continue
+
+            coord = elem.get('r')
+            if not coord:
+                raise _DirectReadUnsupported('cell 無座標')
+            letters = coord.rstrip(_ROW_DIGITS)
+            if max_row and int(coord[len(letters):]) > max_row:
+                break
+            if max_letters and (len(letters), letters) > (len(max_letters), max_letters):
+                continue
+
+            formula = elem.find(_FORMULA_TAG)
+            if formula is not None:
+                ftype = formula.get('t')
+                fstr = "=" if formula.text is None else "=" + formula.text
+                vstr = fstr
+                if ftype == 'array':
+                    vstr = None
+                elif ftype == 'shared':
+                    si = formula.get('si')
+                    if si in shared_formulae:
+                        fstr = vstr = shared_formulae[si].translate_formula(coord)
+                    elif fstr != "=":
+                        shared_formulae[si] = Translator(fstr, coord)
+                elif ftype == 'dataTable':
+                    raise _DirectReadUnsupported('dataTable 公式')
+                ws_data[intern(coord)] = {"formula": fstr, "value": vstr}
+                continue
+
+            data_type = elem.get('t', 'n')
+            if data_type == 'inlineStr':
+                child = elem.find(_INLINE_STRING_TAG)
+                if child is None:
+                    continue
+                value = _inline_string_text(child)
+            else:
+                value = elem.findtext(_VALUE_TAG) or None
+                if value is None:
+                    continue
+                if data_type == 'n':
+                    if '.' in value or 'E' in value or 'e' in value:
+                        value = float(value)
+                    else:
+                        value = int(value)
+                    style_id = elem.get('s')
+                    style_id = int(style_id) if style_id else 0
+                    if style_id in date_formats:
+                        try:
+                            value = from_excel(value, epoch, timedelta=style_id in timedelta_formats)
+                        except (OverflowError, ValueError):
+                            value = "#VALUE!"
+                elif data_type == 's':
+                    value = shared_strings[int(value)]
+                elif data_type == 'b':
+                    value = bool(int(value))
+                elif data_type == 'd':
+                    value = from_ISO8601(value)
+
+            if type(value) not in plain_types:
+                value = serialize_cell_value(value)
+                if value is None:
+                    continue
+            ws_data[intern(coord)] = {"formula": None, "value": value}
+    return ws_data
+
+def _dump_cell_objects(ws):
+    """
+    有公式工作表：逐個 cell object 讀取公式及值
+    """
+    ws_data = {}
+    for row in ws.iter_rows(values_only=False):  # ⚡️ 保證每個 cell 都係 cell object
+        for cell in row:
+            # ⚡️ Patch: formula 直接存 cell.formula if present, fallback get_cell_formula
+            if hasattr(cell, 'formula') and cell.formula:
+                fstr = cell.formula
+            else:
+                fstr = get_cell_formula(cell)
+            vstr = serialize_cell_value(cell.value)
+            if fstr is not None or vstr is not None:
+                ws_data[sys.intern(cell.coordinate)] = {"formula": fstr, "value": vstr}
+    return ws_data
+
 def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
     """
     提取 Excel 檔案中的所有儲存格數據（含公式）
@@ -139,15 +403,13 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
     settings.processing_start_time = time.time()
     
     wb = None
+    archive = None
     try:
         if not silent: 
             print(f"   📊 檔案大小: {os.path.getsize(path)/(1024*1024):.1f} MB")
         
         local_path = copy_to_cache(path, silent=silent)
         
-        # 複製完 sleep 一下，減race condition
-        time.sleep(0.2)
-        
         read_only_mode = True
         if not silent: 
             print(f"   🚀 讀取模式: read_only={read_only_mode}, data_only=False")
@@ -159,28 +421,35 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
         if not silent and show_sheet_detail: 
             print(f"   📋 工作表數量: {worksheet_count}")
         
+        # 直接開啟 zip：供直接解析工作表 XML 及公式探測使用
+        try:
+            archive = zipfile.ZipFile(local_path, 'r')
+        except (zipfile.BadZipFile, OSError):
+            pass
+        
         for idx, ws in enumerate(wb.worksheets, 1):
-            cell_count = 0
-            ws_data = {}
+            ws_data = None
+            member = getattr(ws, '_worksheet_path', None)
             
             if ws.max_row > 1 or ws.max_column > 1:
-                for row in ws.iter_rows(values_only=False):  # ⚡️ 保證每個 cell 都係 cell object
-                    for cell in row:
-                        # ⚡️ Patch: formula 直接存 cell.formula if present, fallback get_cell_formula
-                        if hasattr(cell, 'formula') and cell.formula:
-                            fstr = cell.formula
-                        else:
-                            fstr = get_cell_formula(cell)
-                        vstr = serialize_cell_value(cell.value)
-                        if fstr is not None or vstr is not None:
-                            ws_data[cell.coordinate] = {"formula": fstr, "value": vstr}
-                            cell_count += 1
+                if settings.USE_DIRECT_XML_READER and archive is not None and member:
+                    try:
+                        ws_data = _dump_sheet_xml(archive, ws)
+                    except Exception as e:
+                        if not silent:
+                            logging.warning(f"直接解析工作表 XML 失敗，改用 openpyxl 讀取: {ws.title}, 原因: {e}")
+                if ws_data is None:
+                    if archive is not None and member and not _sheet_has_formulas(archive, member):
+                        ws_data = _dump_values_only(ws)
+                    else:
+                        ws_data = _dump_cell_objects(ws)
+            cell_count = len(ws_data) if ws_data else 0
             
             if show_sheet_detail and not silent: 
                 print(f"      處理工作表 {idx}/{worksheet_count}: {ws.title}（{cell_count} 有資料 cell）")
             
             if ws_data: 
-                result[ws.title] = ws_data
+                result[sys.intern(ws.title)] = ws_data
         
         wb.close()
         wb = None
@@ -195,6 +464,8 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
             logging.error(f"Excel 讀取失敗: {e}")
         return None
     finally:
+        if archive is not None:
+            archive.close()
         if wb: 
             wb.close()
             del wb
@@ -205,14 +476,42 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
 
 def hash_excel_content(cells_dict):
     """
-    計算 Excel 內容的雜湊值
+    計算 Excel 內容的雜湊值（BLAKE2b，比 MD5 更快且不需額外套件）
     """
-    if cells_dict is None: 
-        return None
+    return hash_excel_sheets(cells_dict)[0]
+
+def _sheet_json_bytes(value):
+    """
+    以排序鍵序列化為 JSON bytes：有 orjson 時直接輸出 bytes；orjson 不支援的值（例如超過 64 位元的整數）改用標準 json
+    """
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def hash_excel_sheets(cells_dict):
+    """
+    一次過計算整體內容雜湊及每個工作表的雜湊，回傳 (content_hash, {工作表: 雜湊})；
+    整體雜湊逐個工作表串流計算，毋須一次過序列化整份內容
+    """
+    if cells_dict is None:
+        return None, None
     
     try:
-        content_str = json.dumps(cells_dict, sort_keys=True, ensure_ascii=False)
-        return hashlib.md5(content_str.encode('utf-8')).hexdigest()
-    except (TypeError, json.JSONEncodeError) as e:
+        content = hashlib.blake2b(digest_size=16)
+        content.update(b'{')
+        sheet_hashes = {}
+        for index, sheet_name in enumerate(sorted(cells_dict)):
+            sheet_bytes = _sheet_json_bytes(cells_dict[sheet_name])
+            sheet_hashes[sheet_name] = hashlib.blake2b(sheet_bytes, digest_size=16).hexdigest()
+            if index:
+                content.update(b',')
+            content.update(_sheet_json_bytes(sheet_name) + b':')
+            content.update(sheet_bytes)
+        content.update(b'}')
+        return content.hexdigest(), sheet_hashes
+    except (TypeError, ValueError) as e:
         logging.error(f"計算 Excel 內容雜湊值失敗: {e}")
-        return None
\ No newline at end of file
+        return None, None
@@ -1,19 +1,33 @@
 import os
 import time
+import heapq
+import itertools
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import config.settings as settings
+from core.comparison import compare_excel_changes, set_current_event_number
+from core.baseline import create_baseline_for_files_robust
+from core.excel_parser import get_excel_last_author
 import logging
 
 class ActivePollingHandler:
     """
-    主動輪詢處理器，採用新的智慧輪詢邏輯
+    主動輪詢處理器，採用新的智慧輪詢邏輯；
+    所有輪詢由單一排程執行緒按到期時間（heapq）安排，比較交由工作執行緒池執行，
+    慢檔案不會拖慢其他檔案的輪詢
     """
     def __init__(self):
         self.polling_tasks = {}
         self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
         self.stop_event = threading.Event()
+        self._schedule = []  # (到期時間, generation, file_path, event_number, interval)
+        self._generations = itertools.count(1)
+        self._scheduler_thread = None
+        self.executor = ThreadPoolExecutor(max_workers=max(1, settings.POLL_WORKERS), thread_name_prefix="PollWorker")
 
     def start_polling(self, file_path, event_number):
         """
@@ -33,21 +47,63 @@ class ActivePollingHandler:
 
     def _start_adaptive_polling(self, file_path, event_number, interval):
         """
-        開始自適應輪詢
+        開始自適應輪詢；同一檔案重新開始時換上新的 generation，舊排程到期時會被略過
         """
-        with self.lock:
-            if file_path in self.polling_tasks:
-                self.polling_tasks[file_path]['timer'].cancel()
-
-            def task_wrapper():
-                self._poll_for_stability(file_path, event_number, interval)
+        with self.condition:
+            generation = next(self._generations)
+            self.polling_tasks[file_path] = {'generation': generation}
+            self._schedule_poll(file_path, event_number, interval, generation)
+            if self._scheduler_thread is None:
+                self._scheduler_thread = threading.Thread(target=self._run_scheduler, name="PollingScheduler", daemon=True)
+                self._scheduler_thread.start()
+        print(f"    [輪詢啟動] {interval} 秒後首次檢查 {os.path.basename(file_path)}")
+
+    def _schedule_poll(self, file_path, event_number, interval, generation):
+        """
+        加入排程（呼叫者須持有 lock）
+        """
+        heapq.heappush(self._schedule, (time.monotonic() + interval, generation, file_path, event_number, interval))
+        self.condition.notify()
 
-            timer = threading.Timer(interval, task_wrapper)
-            self.polling_tasks[file_path] = {'timer': timer}
-            timer.start()
-            print(f"    [輪詢啟動] {interval} 秒後首次檢查 {os.path.basename(file_path)}")
+    def _run_scheduler(self):
+        """
+        排程執行緒：等待最早到期的輪詢，到期後交由工作執行緒池檢查
+        """
+        while True:
+            with self.condition:
+                while not self.stop_event.is_set():
+                    if not self._schedule:
+                        self.condition.wait()
+                        continue
+                    delay = self._schedule[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                else:
+                    return
+                _, generation, file_path, event_number, interval = heapq.heappop(self._schedule)
+                task = self.polling_tasks.get(file_path)
+                if task is None or task['generation'] != generation:
+                    continue
+            try:
+                self.executor.submit(self._run_poll, file_path, event_number, interval, generation)
+            except RuntimeError:
+                return  # 已停止，執行緒池已關閉
+
+    def _run_poll(self, file_path, event_number, interval, generation):
+        """
+        工作執行緒：執行一次輪詢檢查，出錯時結束該檔案的輪詢
+        """
+        try:
+            self._poll_for_stability(file_path, event_number, interval, generation)
+        except Exception as e:
+            logging.error(f"輪詢檢查失敗: {file_path}, 錯誤: {e}")
+            with self.lock:
+                task = self.polling_tasks.get(file_path)
+                if task is not None and task['generation'] == generation:
+                    self.polling_tasks.pop(file_path, None)
 
-    def _poll_for_stability(self, file_path, event_number, interval):
+    def _poll_for_stability(self, file_path, event_number, interval, generation):
         """
         執行輪詢檢查，如果檔案變更則延長輪詢，否則結束
         """
@@ -56,23 +112,17 @@ class ActivePollingHandler:
 
         print(f"    [輪詢檢查] 正在檢查 {os.path.basename(file_path)} 的變更...")
 
-        from core.comparison import compare_excel_changes, set_current_event_number
         set_current_event_number(event_number)
         has_changes = compare_excel_changes(file_path, silent=False, event_number=event_number, is_polling=True)
 
-        with self.lock:
-            if file_path not in self.polling_tasks:
+        with self.condition:
+            task = self.polling_tasks.get(file_path)
+            if task is None or task['generation'] != generation:
                 return
 
             if has_changes:
                 print(f"    [輪詢] 檔案仍在變更，延長等待時間，{interval} 秒後再次檢查。")
-                
-                def task_wrapper():
-                    self._poll_for_stability(file_path, event_number, interval)
-                
-                new_timer = threading.Timer(interval, task_wrapper)
-                self.polling_tasks[file_path]['timer'] = new_timer
-                new_timer.start()
+                self._schedule_poll(file_path, event_number, interval, generation)
             else:
                 print(f"    [輪詢結束] {os.path.basename(file_path)} 檔案已穩定。")
                 self.polling_tasks.pop(file_path, None)
@@ -82,10 +132,11 @@ class ActivePollingHandler:
         停止所有輪詢任務
         """
         self.stop_event.set()
-        with self.lock:
-            for task in self.polling_tasks.values():
-                task['timer'].cancel()
+        with self.condition:
             self.polling_tasks.clear()
+            self._schedule.clear()
+            self.condition.notify_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 class ExcelFileEventHandler(FileSystemEventHandler):
     """
@@ -93,7 +144,8 @@ class ExcelFileEventHandler(FileSystemEventHandler):
     """
     def __init__(self, polling_handler):
         self.polling_handler = polling_handler
-        self.last_event_times = {}
+        self.last_event_times = OrderedDict()  # 按最近事件排序，超出上限時移除最舊的
+        self._stat_cache = OrderedDict()  # 最近一次已處理事件的 (大小, 修改時間 ns)，上限同上
         self.event_counter = 0
         
     def on_created(self, event):
@@ -116,7 +168,6 @@ class ExcelFileEventHandler(FileSystemEventHandler):
         print(f"\n✨ 發現新檔案: {os.path.basename(file_path)}")
         print(f"📊 正在建立基準線...")
 
-        from core.baseline import create_baseline_for_files_robust
         create_baseline_for_files_robust([file_path])
 
         print(f"✅ 基準線建立完成，已納入監控: {os.path.basename(file_path)}")
@@ -138,18 +189,29 @@ class ExcelFileEventHandler(FileSystemEventHandler):
         if os.path.basename(file_path).startswith('~$'):
             return
             
-        # 防抖動處理
-        current_time = time.time()
-        if file_path in self.last_event_times:
-            if current_time - self.last_event_times[file_path] < settings.DEBOUNCE_INTERVAL_SEC:
-                return
+        # 檔案大小及修改時間與上次已處理的事件相同（同一次儲存觸發多個事件），毋須再處理
+        try:
+            stat = os.stat(file_path)
+            stat_key = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stat_key = None
+        if stat_key is not None and self._stat_cache.get(file_path) == stat_key:
+            return
+
+        # 防抖動處理（monotonic 時間不受系統時鐘調整影響）
+        current_time = time.monotonic()
+        last_time = self.last_event_times.get(file_path)
+        if last_time is not None and current_time - last_time < settings.DEBOUNCE_INTERVAL_SEC:
+            return
                 
         self.last_event_times[file_path] = current_time
+        self.last_event_times.move_to_end(file_path)
+        if len(self.last_event_times) > settings.DEBOUNCE_MAX_TRACKED_FILES:
+            self.last_event_times.popitem(last=False)
         self.event_counter += 1
         
         # 獲取檔案最後作者
         try:
-            from core.excel_parser import get_excel_last_author
             last_author = get_excel_last_author(file_path)
             author_info = f" (最後儲存者: {last_author})" if last_author != 'Unknown' else ""
         except Exception as e:
@@ -158,7 +220,6 @@ class ExcelFileEventHandler(FileSystemEventHandler):
         print(f"\n🔔 檔案變更偵測: {os.path.basename(file_path)} (事件 #{self.event_counter}){author_info}")
         
         # 🔥 設定事件編號並立即執行一次比較
-        from core.comparison import compare_excel_changes, set_current_event_number
         set_current_event_number(self.event_counter)
         
         # 檢查檔案是否已經在輪詢中
@@ -168,9 +229,17 @@ class ExcelFileEventHandler(FileSystemEventHandler):
 
         print(f"📊 立即檢查變更...")
         has_changes = compare_excel_changes(file_path, silent=False, event_number=self.event_counter, is_polling=False)
+        # 只有成功讀取並比較後才記下檔案狀態；讀取失敗（例如 Excel 仍在儲存）時同一狀態的後續事件須再處理
+        if stat_key is not None and has_changes is not None:
+            self._stat_cache[file_path] = stat_key
+            self._stat_cache.move_to_end(file_path)
+            if len(self._stat_cache) > settings.DEBOUNCE_MAX_TRACKED_FILES:
+                self._stat_cache.popitem(last=False)
         
         if has_changes:
             print(f"✅ 偵測到變更，啟動輪詢以監控後續活動...")
+        elif has_changes is None:
+            print(f"⚠️  未能讀取檔案，啟動輪詢稍後再檢查...")
         else:
             print(f"ℹ️  未發現即時變更，啟動輪詢以監控後續活動...")
         
@@ -4,6 +4,7 @@ Excel Monitor 主執行檔案
 """
 import os
 import sys
+import gc
 import signal
 import threading
 import time
@@ -21,7 +22,7 @@ from utils.memory import check_memory_limit
 from utils.helpers import get_all_excel_files, timeout_handler
 from utils.compression import CompressionFormat, test_compression_support  # 新增
 from ui.console import init_console
-from core.baseline import create_baseline_for_files_robust
+from core.baseline import create_baseline_for_files_robust, flush_pending_baselines
 from core.watcher import active_polling_handler, ExcelFileEventHandler
 from core.comparison import set_current_event_number
 from watchdog.observers import Observer
@@ -47,6 +48,9 @@ def main():
     """
     print("🚀 Excel Monitor v2.1 啟動中...")
     
+    # 調高第 0 代回收門檻：解析大量 cell 時會產生大量短命物件，避免頻繁觸發回收
+    gc.set_threshold(50000, 20, 20)
+    
     # 測試壓縮支援
     test_compression_support()
     
@@ -137,6 +141,7 @@ def main():
         observer.stop()
         observer.join()
         active_polling_handler.stop()
+        flush_pending_baselines()
         print("✅ 監控已停止")
 
 if __name__ == "__main__":
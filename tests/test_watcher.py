@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import config.settings as settings
+from core import comparison, watcher
+
+
+class _FakeEvent:
+    is_directory = False
+
+    def __init__(self, src_path):
+        self.src_path = src_path
+
+
+class _FakePollingHandler:
+    def __init__(self):
+        self.polling_tasks = {}
+        self.started = []
+
+    def start_polling(self, file_path, event_number):
+        self.started.append((file_path, event_number))
+
+
+class StatCacheTest(unittest.TestCase):
+    """
+    讀取失敗時不可記下檔案狀態，同一次儲存的後續事件仍須再比較
+    """
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.root, 'book.xlsx')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'not really a workbook')
+        patcher = mock.patch.multiple(settings, LOG_FOLDER=os.path.join(self.root, 'log'), DEBOUNCE_INTERVAL_SEC=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        for name in ('get_excel_last_author', 'set_current_event_number'):
+            patcher = mock.patch.object(watcher, name, return_value='Unknown')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.handler = watcher.ExcelFileEventHandler(_FakePollingHandler())
+
+    def test_failed_read_does_not_cache_stat(self):
+        with mock.patch.object(comparison, 'dump_excel_cells_with_timeout', return_value=None) as dump, \
+                mock.patch.object(comparison.time, 'sleep'):
+            self.handler.on_modified(_FakeEvent(self.file_path))
+            self.assertEqual(dump.call_count, 2)  # 首次讀取及重試
+            self.assertNotIn(self.file_path, self.handler._stat_cache)
+
+            # 同一檔案狀態的第二個事件不可被跳過
+            self.handler.on_modified(_FakeEvent(self.file_path))
+            self.assertEqual(dump.call_count, 4)
+
+    def test_successful_compare_caches_stat(self):
+        with mock.patch.object(watcher, 'compare_excel_changes', return_value=False) as compare:
+            self.handler.on_modified(_FakeEvent(self.file_path))
+            self.handler.on_modified(_FakeEvent(self.file_path))
+        self.assertEqual(compare.call_count, 1)
+        self.assertIn(self.file_path, self.handler._stat_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,11 @@
 import os
 import json
 import gzip
+import errno
 import time
+import threading
+import functools
+import tempfile
 from datetime import datetime
 import logging
 
@@ -27,6 +31,15 @@ except ImportError as e:
     print(f"[WARNING] Zstandard 模組載入失敗: {e}")
     print("[WARNING] 請執行: pip install zstandard")
 
+try:
+    import orjson
+    HAS_ORJSON = True
+    print("[DEBUG] orjson 模組載入成功")
+except ImportError as e:
+    HAS_ORJSON = False
+    print(f"[WARNING] orjson 模組載入失敗，使用標準 json: {e}")
+    print("[WARNING] 請執行: pip install orjson")
+
 import config.settings as settings
 
 class CompressionFormat:
@@ -73,10 +86,48 @@ class CompressionFormat:
             print(f"[ERROR] LZ4 格式不可用，降級到 gzip")
             return cls.GZIP
         elif format_type == cls.ZSTD and not HAS_ZSTD:
-            print(f"[ERROR] Zstandard 格式不可用，降級到 gzip")
-            return cls.GZIP
+            fallback = cls.LZ4 if HAS_LZ4 else cls.GZIP
+            print(f"[ERROR] Zstandard 格式不可用，降級到 {fallback}")
+            return fallback
         return format_type
 
+@functools.lru_cache(maxsize=None)
+def get_format_search_order(preferred_format, available_only=False):
+    """
+    首選格式排頭的 ((格式, 副檔名), ...) 查找次序
+
+    格式在一次執行中固定，結果快取後每次載入/保存毋須重新組合及查表；
+    available_only=True 時略過未安裝的其他格式（首選格式總是保留）
+    """
+    order = [preferred_format] + [f for f in (CompressionFormat.LZ4, CompressionFormat.ZSTD, CompressionFormat.GZIP) if f != preferred_format]
+    if available_only:
+        available_formats = CompressionFormat.get_available_formats()
+        order = [order[0]] + [f for f in order[1:] if f in available_formats]
+    return tuple((f, CompressionFormat.get_extension(f)) for f in order)
+
+def json_dumps_bytes(data):
+    """
+    序列化為 UTF-8 JSON bytes - 優先使用 orjson，失敗時退回標準 json
+    """
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError as e:
+            logging.warning(f"orjson 序列化失敗，改用標準 json: {e}")
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_loads(raw):
+    """
+    解析 JSON（str 或 bytes）- 優先使用 orjson
+    """
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson 不接受 NaN / Infinity，舊版 json.dumps 寫出的基準線可能含有，交由標準 json 解析
+            pass
+    return json.loads(raw)
+
 def compress_data(data, format_type=None, level=None):
     """
     壓縮數據
@@ -157,9 +208,103 @@ def decompress_data(compressed_data, format_type=None):
             
             raise ValueError("無法解壓縮數據，未知的壓縮格式")
 
+# 每條線程各自重用的壓縮器（zstd / lz4 壓縮器可重複使用但不可跨線程共用）
+_compressor_pool = threading.local()
+
+def get_pooled_compressor(format_type, level):
+    """
+    從線程本地池取得可重用的壓縮器，避免每次保存都重新配置壓縮狀態
+    """
+    pool = getattr(_compressor_pool, 'compressors', None)
+    if pool is None:
+        pool = _compressor_pool.compressors = {}
+    
+    key = (format_type, level)
+    compressor = pool.get(key)
+    if compressor is None:
+        if format_type == CompressionFormat.ZSTD:
+            compressor = zstd.ZstdCompressor(level=level, threads=settings.ZSTD_THREADS)
+        else:
+            compressor = lz4.frame.LZ4FrameCompressor(compression_level=level)
+        pool[key] = compressor
+    return compressor
+
+def write_compressed(fileobj, payload, format_type, level=None):
+    """
+    把數據壓縮並寫入已開啟的二進位檔案物件
+    """
+    if format_type == CompressionFormat.LZ4 and HAS_LZ4:
+        compressor = get_pooled_compressor(format_type, level or settings.LZ4_COMPRESSION_LEVEL)
+        compressor.reset()  # 上次寫入中途失敗時，清除殘留的壓縮狀態
+        fileobj.write(compressor.begin(len(payload)))
+        fileobj.write(compressor.compress(payload))
+        fileobj.write(compressor.flush())
+    
+    elif format_type == CompressionFormat.ZSTD and HAS_ZSTD:
+        compressor = get_pooled_compressor(format_type, level or settings.ZSTD_COMPRESSION_LEVEL)
+        with compressor.stream_writer(fileobj, size=len(payload), closefd=False) as writer:
+            writer.write(payload)
+    
+    else:
+        compression_level = level or settings.GZIP_COMPRESSION_LEVEL
+        with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=compression_level) as writer:
+            writer.write(payload)
+
+def open_compressed_reader(filepath, format_type):
+    """
+    開啟串流解壓讀取器（二進位），讀取時直接解壓
+    """
+    if format_type == CompressionFormat.LZ4 and HAS_LZ4:
+        return lz4.frame.open(filepath, 'rb')
+    
+    elif format_type == CompressionFormat.ZSTD and HAS_ZSTD:
+        decompressor = zstd.ZstdDecompressor()
+        return decompressor.stream_reader(open(filepath, 'rb'))
+    
+    else:
+        return gzip.open(filepath, 'rb')
+
+# 檔案被暫時鎖住時的錯誤碼（其他 OSError 屬永久錯誤，重試亦無用）
+_TRANSIENT_ERRNOS = (errno.EACCES, errno.EBUSY)
+
+def replace_file_with_retry(src, dst, max_retry=5, delay=0.1, max_delay=2.0):
+    """
+    以 os.replace 原子性地用 src 取代 dst
+
+    只在檔案被暫時鎖住（防毒軟件/索引服務）時重試，等待時間按指數遞增並設上限
+    """
+    for attempt in range(max_retry):
+        try:
+            os.replace(src, dst)
+            return
+        except OSError as e:
+            if not isinstance(e, PermissionError) and e.errno not in _TRANSIENT_ERRNOS:
+                raise
+            if attempt == max_retry - 1:
+                raise
+            time.sleep(min(delay * (2 ** attempt), max_delay))
+
+def create_temp_file(target_path):
+    """
+    在目標檔案同一目錄建立名稱唯一的臨時檔案，回傳 (fd, 臨時檔路徑)；
+    多個線程同時寫入同一目標時各自使用自己的臨時檔，不會互相截斷
+    """
+    return tempfile.mkstemp(
+        dir=os.path.dirname(target_path) or '.',
+        prefix=os.path.basename(target_path) + '.',
+        suffix='.tmp'
+    )
+
+# 壓縮輸出的寫入緩衝大小：把壓縮器的零碎輸出合併成大塊寫入
+WRITE_BUFFER_SIZE = 1 << 20
+
 def save_compressed_file(filepath, data, format_type=None, level=None):
     """
     保存壓縮檔案
+    
+    JSON 只序列化一次（orjson 或標準 json 的 C 編碼器），然後串流寫入壓縮器，
+    不再在記憶體中保留完整的壓縮結果。先寫入臨時檔案，再以 os.replace
+    原子性地取代正式檔案，寫入中途失敗不會留下損壞的基準線。
     """
     if format_type is None:
         format_type = settings.DEFAULT_COMPRESSION_FORMAT
@@ -167,74 +312,69 @@ def save_compressed_file(filepath, data, format_type=None, level=None):
     # 驗證格式可用性
     format_type = CompressionFormat.validate_format(format_type)
     
-    # 準備數據
+    # 準備數據：只淺複製頂層字典再加入時間戳，不修改呼叫者的字典
+    # （其他線程可能同時讀取同一份待寫入的基準線）
     if isinstance(data, dict):
-        json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        payload = json_dumps_bytes(dict(
+            data,
+            timestamp=datetime.now().isoformat(timespec='seconds'),
+            compression_format=format_type
+        ))
     else:
-        json_data = str(data)
-    
-    # 添加時間戳
-    if isinstance(data, dict):
-        data_with_timestamp = data.copy()
-        data_with_timestamp['timestamp'] = datetime.now().isoformat()
-        data_with_timestamp['compression_format'] = format_type
-        json_data = json.dumps(data_with_timestamp, ensure_ascii=False, separators=(',', ':'))
-    
-    # 壓縮數據
-    compressed_data = compress_data(json_data, format_type, level)
+        payload = str(data).encode('utf-8')
     
     # 確定最終檔案路徑
     extension = CompressionFormat.get_extension(format_type)
     final_filepath = filepath + extension
     
-    # 🔥 移除這行 - 過於詳細的調試訊息
-    # print(f"[DEBUG] 保存壓縮檔案: {final_filepath}")
+    fd, temp_filepath = create_temp_file(final_filepath)
     
-    # 寫入檔案
-    with open(final_filepath, 'wb') as f:
-        f.write(compressed_data)
+    # 串流壓縮寫入臨時檔案，with 區塊結束即保證檔案已關閉
+    try:
+        with open(fd, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            write_compressed(f, payload, format_type, level)
+        replace_file_with_retry(temp_filepath, final_filepath)
+    except BaseException:
+        try:
+            os.remove(temp_filepath)
+        except OSError:
+            pass
+        raise
     
     return final_filepath
 
-def load_compressed_file(filepath):
+def resolve_compressed_file(filepath):
     """
-    載入壓縮檔案 - 優先選擇設定的格式
+    找出 load_compressed_file 會讀取的實際檔案路徑，不存在時回傳 None
     """
-    # 嘗試不同的檔案路徑
-    possible_paths = []
+    search_order = get_format_search_order(settings.DEFAULT_COMPRESSION_FORMAT, available_only=True)
     
-    if os.path.exists(filepath):
-        possible_paths.append(filepath)
+    # 優先選擇設定的格式，而不是最新的檔案：首選檔案存在時毋須再檢查其他格式
+    preferred_file = filepath + search_order[0][1]
+    if os.path.exists(preferred_file):
+        return preferred_file
     
-    # 按優先順序添加副檔名 - 優先使用設定的格式
-    preferred_format = settings.DEFAULT_COMPRESSION_FORMAT
-    available_formats = CompressionFormat.get_available_formats()
-    
-    # 重新排序：首選格式放在最前面
-    ordered_formats = [preferred_format] + [f for f in available_formats if f != preferred_format]
-    
-    for format_type in ordered_formats:
-        ext = CompressionFormat.get_extension(format_type)
-        test_path = filepath + ext
-        if os.path.exists(test_path):
-            possible_paths.append(test_path)
+    possible_paths = [filepath] if os.path.exists(filepath) else []
+    possible_paths += [filepath + ext for _, ext in search_order[1:] if os.path.exists(filepath + ext)]
     
     if not possible_paths:
         return None
     
-    # 優先選擇設定的格式，而不是最新的檔案
-    preferred_ext = CompressionFormat.get_extension(preferred_format)
-    preferred_file = filepath + preferred_ext
-    
-    if preferred_file in possible_paths:
-        latest_file = preferred_file
-        # 🔥 移除這行 - 過於詳細的調試訊息
-        # print(f"[DEBUG] 使用首選格式檔案: {latest_file}")
-    else:
-        # 如果首選格式不存在，選擇最新的檔案
-        latest_file = max(possible_paths, key=os.path.getmtime)
-        # 🔥 移除這行 - 過於詳細的調試訊息
-        # print(f"[DEBUG] 首選格式不存在，使用最新檔案: {latest_file}")
+    # 如果首選格式不存在，選擇最新的檔案
+    return max(possible_paths, key=os.path.getmtime)
+
+# 載入時可能遇到的錯誤：檔案存取、JSON 損壞 (ValueError)、壓縮資料損壞（gzip 截斷為 EOFError，lz4 為 RuntimeError）
+_LOAD_ERRORS = (OSError, ValueError, EOFError, RuntimeError)
+if HAS_ZSTD:
+    _LOAD_ERRORS += (zstd.ZstdError,)
+
+def load_compressed_file(filepath, resolved_file=None):
+    """
+    載入壓縮檔案 - 優先選擇設定的格式（resolved_file 為已由 resolve_compressed_file 找出的路徑）
+    """
+    latest_file = resolved_file or resolve_compressed_file(filepath)
+    if latest_file is None:
+        return None
     
     # 檢測格式
     format_type = CompressionFormat.detect_format(latest_file)
@@ -242,11 +382,9 @@ def load_compressed_file(filepath):
     # print(f"[DEBUG] 檢測到格式: {format_type}")
     
     try:
-        with open(latest_file, 'rb') as f:
-            compressed_data = f.read()
-        json_data = decompress_data(compressed_data, format_type)
-        return json.loads(json_data)
-    except (FileNotFoundError, PermissionError, OSError) as e:
+        with open_compressed_reader(latest_file, format_type) as f:
+            return json_loads(f.read())
+    except _LOAD_ERRORS as e:
         logging.error(f"載入壓縮檔案失敗 {latest_file}: {e}")
         return None
 
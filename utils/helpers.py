@@ -4,11 +4,27 @@
 import os
 import time
 import json
+import hashlib
 import threading
 from datetime import datetime
 import config.settings as settings
 import logging
 
+# 目前秒數的時間字串快取 (epoch 秒, 'YYYY-MM-DD HH:MM:SS')
+_now_str_cache = (None, '')
+
+def now_str():
+    """
+    目前本地時間 'YYYY-MM-DD HH:MM:SS'，同一秒內重用已格式化的字串
+    """
+    global _now_str_cache
+    second = int(time.time())
+    cached_second, text = _now_str_cache
+    if second != cached_second:
+        text = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        _now_str_cache = (second, text)
+    return text
+
 def get_file_mtime(filepath):
     """
     獲取檔案修改時間
@@ -25,6 +41,37 @@ def get_file_mtime(filepath):
         logging.error(f"存取檔案時發生 I/O 錯誤: {filepath}，錯誤: {e}")
         return "IOError"
 
+def get_file_signature(filepath):
+    """
+    獲取檔案簽名 [大小, 修改時間 (ns)]，用於判斷檔案自建立基準線後有否改動；
+    無法存取時回傳 None
+    """
+    try:
+        stat = os.stat(filepath)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+_RAW_HASH_CHUNK = 1024 * 1024
+
+def get_file_raw_hash(filepath):
+    """
+    計算檔案原始位元組的 BLAKE2b 雜湊（分塊讀取，不載入整個檔案）；無法讀取時回傳 None
+    """
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        buffer = bytearray(_RAW_HASH_CHUNK)
+        view = memoryview(buffer)
+        with open(filepath, 'rb') as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                digest.update(view[:size])
+        return digest.hexdigest()
+    except OSError:
+        return None
+
 def human_readable_size(num_bytes):
     """
     轉換檔案大小為人類可讀格式
@@ -86,7 +133,7 @@ def save_progress(completed_files, total_files):
         
         with open(settings.RESUME_LOG_FILE, 'w', encoding='utf-8') as f: 
             json.dump(progress_data, f, ensure_ascii=False, indent=2)
-    except (OSError, json.JSONEncodeError) as e: 
+    except (OSError, TypeError, ValueError) as e: 
         logging.error(f"無法儲存進度: {e}")
 
 def load_progress():
@@ -2,9 +2,14 @@
 日誌和打印功能
 """
 import builtins
-from datetime import datetime
+from functools import lru_cache
 from io import StringIO
-from wcwidth import wcswidth, wcwidth
+# 優先使用 C 實作的 cwcwidth，未安裝時退回純 Python 的 wcwidth（兩者介面相同）
+try:
+    from cwcwidth import wcswidth, wcwidth
+except ImportError:
+    from wcwidth import wcswidth, wcwidth
+from utils.helpers import now_str
 
 # 保存原始 print 函數
 _original_print = builtins.print
@@ -18,21 +23,18 @@ def timestamped_print(*args, **kwargs):
         _original_print(*args, **kwargs)
         return
 
-    output_buffer = StringIO()
-    _original_print(*args, file=output_buffer, **kwargs)
-    message = output_buffer.getvalue()
-    output_buffer.close()
+    if kwargs:
+        output_buffer = StringIO()
+        _original_print(*args, file=output_buffer, **kwargs)
+        message = output_buffer.getvalue()
+        output_buffer.close()
+    else:
+        # 沒有 sep/end 等參數時結果與 print 相同（結尾換行其後會被 rstrip 去掉）
+        message = ' '.join(map(str, args))
 
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # 簡化邏輯：所有行都加時間戳記
-    lines = message.rstrip().split('\n')
-    timestamped_lines = []
-    
-    for line in lines:
-        timestamped_lines.append(f"[{timestamp}] {line}")
-    
-    timestamped_message = '\n'.join(timestamped_lines)
+    # 簡化邏輯：所有行都加時間戳記；多行訊息（如比較表格）一次過接合後只輸出一次
+    prefix = f"[{now_str()}] "
+    timestamped_message = prefix + ('\n' + prefix).join(message.rstrip().split('\n'))
     _original_print(timestamped_message)
     
     # 檢查是否為比較表格訊息
@@ -56,6 +58,57 @@ def init_logging():
     """
     builtins.print = timestamped_print
 
+# U+0000..U+FFFF 的 wcwidth 查表，首次使用時建立（wcwidth 約 0.1 秒，cwcwidth 更快）；
+# 表內以 _NONPRINTABLE 代表 wcwidth 回傳 -1 的控制字元
+_WCWIDTH_TABLE = None
+_WCWIDTH_TRANS = None
+_NONPRINTABLE = 255
+
+def _get_wcwidth_table():
+    global _WCWIDTH_TABLE
+    if _WCWIDTH_TABLE is None:
+        _WCWIDTH_TABLE = bytes(
+            w if w >= 0 else _NONPRINTABLE for w in map(wcwidth, map(chr, range(0x10000)))
+        )
+    return _WCWIDTH_TABLE
+
+def _get_wcwidth_trans():
+    global _WCWIDTH_TRANS
+    if _WCWIDTH_TRANS is None:
+        _WCWIDTH_TRANS = _get_wcwidth_table().decode('latin-1')
+    return _WCWIDTH_TRANS
+
+def char_width(char):
+    """
+    單一字元的顯示闊度，結果與 wcwidth 相同（控制字元回傳 -1），BMP 範圍內直接查表
+    """
+    code = ord(char)
+    if code < 0x10000:
+        w = _get_wcwidth_table()[code]
+        return -1 if w == _NONPRINTABLE else w
+    return _astral_wcwidth(char)
+
+@lru_cache(maxsize=4096)
+def _astral_wcwidth(char):
+    """
+    BMP 以外字元（emoji 等）不在查表範圍，快取 wcwidth 的二分搜尋結果
+    """
+    return wcwidth(char)
+
+def char_widths(text):
+    """
+    一次取得字串每個字元的顯示闊度列表（與逐字呼叫 char_width 結果相同）
+    """
+    try:
+        # str.translate 以查表字串把每個 BMP 字元換成其闊度值，整個過程在 C 層完成；
+        # BMP 以外的字元不在表內會原樣保留，令 latin-1 編碼失敗
+        widths = list(text.translate(_get_wcwidth_trans()).encode('latin-1'))
+    except UnicodeEncodeError:
+        return list(map(char_width, text))
+    if _NONPRINTABLE in widths:
+        widths = [-1 if w == _NONPRINTABLE else w for w in widths]
+    return widths
+
 def wrap_text_with_cjk_support(text, width):
     """
     自研的、支持 CJK 字符寬度的智能文本換行函數
@@ -64,17 +117,17 @@ def wrap_text_with_cjk_support(text, width):
     line = ""
     current_width = 0
     for char in text:
-        char_width = wcwidth(char)
-        if char_width < 0: 
+        w = char_width(char)
+        if w < 0: 
             continue # 跳過控制字符
 
-        if current_width + char_width > width:
+        if current_width + w > width:
             lines.append(line)
             line = char
-            current_width = char_width
+            current_width = w
         else:
             line += char
-            current_width += char_width
+            current_width += w
     if line:
         lines.append(line)
     return lines or ['']
@@ -83,4 +136,12 @@ def _get_display_width(text):
     """
     精準計算一個字串的顯示闊度，處理 CJK 全形字元
     """
-    return wcswidth(str(text))
\ No newline at end of file
+    text = str(text)
+    # 零寬連接符 / VS16 的組合規則交由 wcswidth 處理
+    if '\u200d' in text or '\ufe0f' in text:
+        return wcswidth(text)
+    
+    widths = char_widths(text)
+    if -1 in widths:
+        return -1
+    return sum(widths)
\ No newline at end of file
@@ -23,6 +23,15 @@ def get_memory_usage():
         logging.error(f"獲取內存使用量時發生未知錯誤: {e}", exc_info=True)
         return 0
 
+# 記憶體過高時、垃圾回收前呼叫的釋放函數（例如清空快取）
+_release_handlers = []
+
+def register_memory_release_handler(handler):
+    """
+    登記記憶體使用量超出限制時呼叫的釋放函數
+    """
+    _release_handlers.append(handler)
+
 def check_memory_limit():
     """
     檢查記憶體使用是否超過限制
@@ -34,6 +43,11 @@ def check_memory_limit():
     if current_memory > settings.MEMORY_LIMIT_MB:
         print(f"⚠️ 記憶體使用量過高: {current_memory:.1f} MB > {settings.MEMORY_LIMIT_MB} MB")
         print("   正在執行垃圾回收...")
+        for handler in _release_handlers:
+            try:
+                handler()
+            except Exception as e:
+                logging.error(f"釋放記憶體失敗: {e}")
         gc.collect()
         new_memory = get_memory_usage()
         print(f"   垃圾回收後: {new_memory:.1f} MB")